@@ -0,0 +1,90 @@
+"""
+Steady-state benchmark for the dashboard widgets.
+
+Mounts DashBoard, Mem and Disk in a headless Textual app fed by a real
+MetricsSampler, and counts the widgets mounted per minute once the first
+readings are in. Widgets that update in place mount nothing after that; a
+widget that recomposes on every sample shows up here.
+
+    python bench_dashboard.py                    # 10 s at the 1 s tick
+    python bench_dashboard.py --interval 0.1     # more ticks per second
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from textual.app import App, ComposeResult
+from textual.containers import VerticalScroll
+
+from dashboard import DashBoard
+from disk import Disk
+from history import MetricsHistory
+from mem import Mem
+from metrics import MetricsSampler
+
+
+class DashboardApp(App):
+    CSS_PATH = Path(__file__).with_name("main.tcss")
+
+    def __init__(self, interval: float, history: Path):
+        super().__init__()
+        self.metrics = MetricsSampler(interval)
+        self.metrics_history = MetricsHistory(history)
+        self.mounts: Counter[str] = Counter()
+
+    def compose(self) -> ComposeResult:
+        with VerticalScroll():
+            yield DashBoard()
+            yield Mem()
+            yield Disk()
+
+    def _register(self, parent, *widgets, **kwargs):
+        for widget in widgets:
+            self.mounts[type(widget).__name__] += 1
+        return super()._register(parent, *widgets, **kwargs)
+
+    def on_unmount(self) -> None:
+        self.metrics.close()
+        self.metrics_history.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        app = DashboardApp(args.interval, Path(tmp))
+        async with app.run_test(size=(args.columns, args.lines)) as pilot:
+            # the first readings mount the disk rows
+            await pilot.pause(args.warmup)
+            app.mounts.clear()
+            subscriptions = app.metrics.subscriptions
+            calls = {subscription.name: subscription.calls for subscription in subscriptions}
+
+            start = time.perf_counter()
+            await pilot.pause(args.seconds)
+            elapsed = time.perf_counter() - start
+
+            print(f"{'subscriber':<24} {'calls':>6} {'avg ms':>7}")
+            for subscription in subscriptions:
+                new_calls = subscription.calls - calls[subscription.name]
+                average = subscription.total_time / subscription.calls if subscription.calls else 0.0
+                print(f"{subscription.name:<24} {new_calls:>6} {average * 1e3:>7.2f}")
+
+    mounts = sum(app.mounts.values())
+    print(f"{elapsed:.1f} s, {mounts} widgets mounted, {mounts * 60 / elapsed:.1f} per minute")
+    for name, count in app.mounts.most_common():
+        print(f"  {name:<22} {count:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured time")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before measuring")
+    parser.add_argument("--interval", type=float, default=1.0, help="sampler tick in seconds")
+    parser.add_argument("--columns", type=int, default=120)
+    parser.add_argument("--lines", type=int, default=80)
+    asyncio.run(main(parser.parse_args()))
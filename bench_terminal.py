@@ -0,0 +1,194 @@
+"""
+Replay benchmark for the terminal emulator.
+
+Replays PTY byte streams through TerminalEmulator and the Terminal widget in
+a headless Textual app. The stream is written by `cat` into the PTY, so no
+shell is involved and every run sees the same bytes.
+
+    python bench_terminal.py                 # built-in sample streams
+    python bench_terminal.py session.log     # captured streams, e.g. from `script`
+    python bench_terminal.py --parse-in-thread --fps 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import resource
+import shlex
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from textual.app import App, ComposeResult
+
+from textual_terminal import Terminal
+
+
+def sample_pip_install(packages: int = 400) -> bytes:
+    """pip install output: plain lines plus a few colored warnings."""
+
+    rng = random.Random(0)
+    lines = []
+    for k in range(packages):
+        name = f"package-{k}"
+        version = f"{rng.randint(0, 9)}.{rng.randint(0, 30)}.{rng.randint(0, 9)}"
+        lines.append(f"Collecting {name}=={version}")
+        lines.append(f"  Downloading {name}-{version}-py3-none-any.whl ({rng.randint(10, 9000)} kB)")
+        if k % 25 == 0:
+            lines.append(f"\x1b[33mWARNING: {name} {version} is yanked\x1b[0m")
+    lines.append("Installing collected packages: " + ", ".join(f"package-{k}" for k in range(packages)))
+    lines.append(f"\x1b[32mSuccessfully installed {packages} packages\x1b[0m")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def sample_tqdm(bars: int = 20, steps: int = 500) -> bytes:
+    """tqdm progress bars: one line rewritten with carriage returns."""
+
+    out = []
+    for bar in range(bars):
+        for step in range(steps + 1):
+            filled = step * 40 // steps
+            out.append(
+                f"\repoch {bar}: {step * 100 // steps:3d}%|{'█' * filled}{' ' * (40 - filled)}| "
+                f"{step}/{steps} [00:{step % 60:02d}<00:00, {step * 3.7:.2f}it/s]"
+            )
+        out.append("\n")
+    return "".join(out).encode()
+
+
+def sample_htop(frames: int = 200, lines: int = 40, columns: int = 120) -> bytes:
+    """htop-like frames: alternate screen, cursor positioning, 256 colors."""
+
+    rng = random.Random(0)
+    out = ["\x1b[?1049h\x1b[?1000h"]
+    for _ in range(frames):
+        out.append("\x1b[H")
+        for y in range(lines):
+            cpu = rng.randint(0, 100)
+            bar = "|" * (cpu * 30 // 100)
+            out.append(
+                f"\x1b[{y + 1};1H\x1b[38;5;{16 + y % 200}m{y:3d}\x1b[0m "
+                f"[\x1b[32m{bar:<30}\x1b[0m\x1b[1m{cpu:3d}%\x1b[0m] "
+                f"\x1b[48;5;236m{'python train.py --epochs 100':<{columns - 42}}\x1b[0m"
+            )
+    out.append("\x1b[?1000l\x1b[?1049l")
+    return "".join(out).encode()
+
+
+def sample_cat(size: int = 8 * 1024 * 1024) -> bytes:
+    """A large plain log file."""
+
+    line = b"2026-01-01 12:00:00,000 INFO training step loss=0.12345 lr=0.0001 grad_norm=1.2345\n"
+    return line * (size // len(line))
+
+
+SAMPLES = {
+    "pip_install": sample_pip_install,
+    "tqdm": sample_tqdm,
+    "htop": sample_htop,
+    "cat": sample_cat,
+}
+
+
+class ReplayApp(App):
+    def __init__(self, terminal: Terminal):
+        super().__init__()
+        self.terminal = terminal
+
+    def compose(self) -> ComposeResult:
+        yield self.terminal
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def replay(path: Path, args: argparse.Namespace) -> dict:
+    terminal = Terminal(
+        command=f"cat {shlex.quote(str(path))}",
+        max_fps=args.fps,
+        parse_in_thread=args.parse_in_thread,
+    )
+
+    # time every frame the scheduler draws
+    frame_times: list[float] = []
+    update_display = terminal.update_display
+
+    def timed_update_display() -> None:
+        start = time.perf_counter()
+        update_display()
+        frame_times.append(time.perf_counter() - start)
+
+    terminal.update_display = timed_update_display
+
+    app = ReplayApp(terminal)
+    async with app.run_test(size=(args.columns, args.lines)) as pilot:
+        await pilot.pause()
+        if args.memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        terminal.start()
+        # the widget stops the emulator when `cat` exits and the PTY closes
+        while terminal.emulator is not None:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+        tracemalloc.stop()
+
+    size = path.stat().st_size
+    return {
+        "bytes": size,
+        "seconds": elapsed,
+        "throughput": size / elapsed,
+        "frames": len(frame_times),
+        "p50": percentile(frame_times, 50),
+        "p95": percentile(frame_times, 95),
+        "p99": percentile(frame_times, 99),
+        "peak": peak,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        streams = [Path(name) for name in args.streams]
+        if not streams:
+            for name, sample in SAMPLES.items():
+                path = Path(tmp) / f"{name}.log"
+                path.write_bytes(sample())
+                streams.append(path)
+
+        print(
+            f"{'stream':<16} {'size':>9} {'time':>8} {'MB/s':>8} {'frames':>7} "
+            f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'peak MB':>8}"
+        )
+        for path in streams:
+            result = await replay(path, args)
+            peak = result["peak"]
+            print(
+                f"{path.stem:<16} {result['bytes'] / 1e6:>7.2f}MB {result['seconds']:>7.2f}s "
+                f"{result['throughput'] / 1e6:>8.2f} {result['frames']:>7} "
+                f"{result['p50'] * 1e3:>7.2f} {result['p95'] * 1e3:>7.2f} {result['p99'] * 1e3:>7.2f} "
+                f"{peak / 1e6 if peak is not None else float('nan'):>8.1f}"
+            )
+
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    print(f"process peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("streams", nargs="*", help="captured PTY streams, defaults to the built-in samples")
+    parser.add_argument("--fps", type=int, default=60, help="Terminal max_fps")
+    parser.add_argument("--parse-in-thread", action="store_true", help="Terminal parse_in_thread")
+    parser.add_argument("--columns", type=int, default=120)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory (slower)")
+    asyncio.run(main(parser.parse_args()))
@@ -1,4 +1,10 @@
-from math import ceil
+from collections import deque
+from math import ceil, isnan
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # String lookup and list lookup are equally fast, see
 # <https://gist.github.com/nschloe/d790a873081dc504193c99d3758755b4>
@@ -19,12 +25,61 @@ num_to_braille_upside_down = [
 ]
 
 
-def _transpose(l):
-    # https://stackoverflow.com/a/6473724/353337
-    return map(list, zip(*l))
+_column_tables: dict[tuple[int, bool], dict[int, str]] = {}
+
+
+def _column_table(height: int, flipud: bool) -> dict[int, str]:
+    return _column_tables.setdefault((height, flipud), {})
+
+
+def resample(values, count: int) -> list[float | None]:
+    """Shrinks `values` to `count` values, the maximum of each bucket.
+
+    The maximum keeps short peaks visible when hours of samples are drawn
+    in a few dozen characters. None values are gaps: a bucket of gaps only
+    is a gap.
+    """
+
+    n = len(values)
+    if n <= count:
+        return list(values)
+    if count <= 0:
+        return []
+    edges = [n * k // count for k in range(count)]
+    if np is not None:
+        # fmax skips the NaNs the gaps become
+        maxima = np.fmax.reduceat(np.asarray(values, dtype=float), edges).tolist()
+        return [None if isnan(value) else value for value in maxima]
+    edges.append(n)
+    return [
+        max((value for value in values[edges[k]:edges[k + 1]] if value is not None), default=None)
+        for k in range(count)
+    ]
+
+
+def braille_rows(values, width: int, height: int, minval: float, maxval: float, flipud: bool = False) -> list[str]:
+    """Draws a whole history into `height` rows of `width` characters."""
+
+    stream = BrailleStream(width, height, minval, maxval, flipud)
+    stream.set_values(resample(values, 2 * width + 1))
+    return stream.graph
 
 
 class BrailleStream:
+    """A scrolling chart of braille characters, two values per character.
+
+    Values and the character columns they produce are kept in fixed-size
+    ring buffers (deques with a maxlen), so `add_value` costs O(height)
+    whatever the width. The row strings are only joined when `graph` is
+    read, and cached until the next value arrives.
+
+    Resizing redraws all stored values in one batch (`set_values`): the
+    values are turned into dot levels at once (with NumPy when available)
+    and the columns come from a lookup table keyed by pairs of levels.
+
+    A None value is a gap (e.g. no history recorded): it is drawn blank.
+    """
+
     def __init__(
         self,
         width: int,
@@ -33,35 +88,63 @@ class BrailleStream:
         maxval: float,
         flipud: bool = False,
     ):
-        # Store two alternating sets of graphs. This is necessary because
-        # Braille symbols fit two values in each character.
-        self._graphs = [
-            [" " * width] * height,
-            [" " * width] * height,
-        ]
-        self.graph_0_is_active = True
         self.width = width
         self.height = height
         self.minval = minval
         self.maxval = maxval
-        self._last_blocks = [0] * height
-        # store all values for resize purposes
-        # we store one more value than what is displayed to account for the "old" graph
-        self.values: list[float] = [minval] * (2 * self.width + 1)
         self.flipud = flipud
         self.lookup = num_to_braille_upside_down if flipud else num_to_braille
+        self._last_level = 0
+        self._column_table = _column_table(height, flipud)
+        # store all values for resize purposes
+        # we store one more value than what is displayed to account for the "old" graph
+        self._values: deque[float | None] = deque([None] * (2 * width + 1), maxlen=2 * width + 1)
+        # one column (top to bottom) per pair of consecutive values. Braille
+        # symbols fit two values in each character: the graph shows every
+        # second column, ending with the newest one.
+        self._columns: deque[str] = deque([" " * height] * (2 * width), maxlen=2 * width)
+        self._graph: list[str] | None = None
+
+    @property
+    def values(self) -> list[float | None]:
+        return list(self._values)
+
+    def value_to_level(self, value: float | None) -> int:
+        """The number of dots (0 to 4 * height) of a value."""
+
+        if value is None or value < self.minval:
+            return 0
+        elif value > self.maxval:
+            return 4 * self.height
+        diff = self.maxval - self.minval
+        if diff == 0:
+            diff = 1
+        return ceil((value - self.minval) / diff * 4 * self.height)
+
+    def values_to_levels(self, values) -> list[int]:
+        """`value_to_level` for a whole sequence at once."""
+
+        top = 4 * self.height
+        diff = self.maxval - self.minval
+        if diff == 0:
+            diff = 1
+        if np is not None:
+            array = np.asarray(values, dtype=float)
+            levels = np.ceil((array - self.minval) / diff * top)
+            # None became NaN: no dots
+            levels[(array < self.minval) | np.isnan(array)] = 0
+            levels[array > self.maxval] = top
+            return levels.astype(int).tolist()
+
+        minval, maxval = self.minval, self.maxval
+        return [
+            0 if value is None or value < minval else top if value > maxval else ceil((value - minval) / diff * top)
+            for value in values
+        ]
 
     def value_to_blocks(self, value: float):
         # value -> number of dots
-        if value < self.minval:
-            k = 0
-        elif value > self.maxval:
-            k = 4 * self.height
-        else:
-            diff = self.maxval - self.minval
-            if diff == 0:
-                diff = 1
-            k = ceil((value - self.minval) / diff * 4 * self.height)
+        k = self.value_to_level(value)
         # form blocks of 4
         blocks = [4] * (k // 4)
         if k % 4 > 0:
@@ -69,79 +152,78 @@ class BrailleStream:
         blocks += [0] * (self.height - len(blocks))
         return blocks
 
-    def add_value(self, value: float):
-        blocks = self.value_to_blocks(value)
-
-        chars = [self.lookup[i0][i1] for i0, i1 in zip(self._last_blocks, blocks)]
-        if not self.flipud:
-            chars = chars[::-1]
-
-        # alternate between graphs[0] and graphs[1]
-        self.graph_0_is_active = not self.graph_0_is_active
-        g = self._graphs[0 if self.graph_0_is_active else 1]
-
-        # update stream
-        for k, char in enumerate(chars):
-            g[k] = g[k][1:] + char
-
-        self.values = self.values[1:] + [value]
-        self._last_blocks = blocks
+    def _column(self, level0: int, level1: int) -> str:
+        # a lookup table filled on demand and shared by all charts of the
+        # same height: a chart only ever shows a few hundred distinct pairs
+        key = level0 * (4 * self.height + 1) + level1
+        column = self._column_table.get(key)
+        if column is None:
+            # rows (bottom up) below `full` have all dots, rows from `empty` none
+            full = min(level0, level1) // 4
+            empty = ceil(max(level0, level1) / 4)
+            column = self.lookup[4][4] * full + "".join([
+                self.lookup[min(max(level0 - 4 * k, 0), 4)][min(max(level1 - 4 * k, 0), 4)]
+                for k in range(full, empty)
+            ]) + self.lookup[0][0] * (self.height - empty)
+            if not self.flipud:
+                column = column[::-1]
+            self._column_table[key] = column
+        return column
+
+    def add_value(self, value: float | None):
+        level = self.value_to_level(value)
+        self._columns.append(self._column(self._last_level, level))
+        self._values.append(value)
+        self._last_level = level
+        self._graph = None
+
+    def set_values(self, values):
+        """Replaces the chart with the last 2 * width + 1 `values` in one pass."""
+
+        values = list(values[len(values) - (2 * self.width + 1):] if len(values) > 2 * self.width + 1 else values)
+        values = [None] * (2 * self.width + 1 - len(values)) + values
+        levels = self.values_to_levels(values)
+        column = self._column
+        self._values = deque(values, maxlen=2 * self.width + 1)
+        self._columns = deque(map(column, levels[:-1], levels[1:]), maxlen=2 * self.width)
+        self._last_level = levels[-1]
+        self._graph = None
 
     @property
-    def graph(self):
-        return self._graphs[0 if self.graph_0_is_active else 1]
+    def graph(self) -> list[str]:
+        if self._graph is None:
+            # every second column, ending with the newest one
+            columns = list(self._columns)[1::2]
+            if columns:
+                self._graph = ["".join(row) for row in zip(*columns)]
+            else:
+                self._graph = [""] * self.height
+        return self._graph
 
     def reset_width(self, width: int):
         if width == self.width:
             return
-        elif width > self.width:
+
+        values = list(self._values)
+        columns = list(self._columns)
+        if width > self.width:
             diff = width - self.width
-            self._graphs = [[" " * diff + row for row in g] for g in self._graphs]
-            self.values = [self.minval] * (2 * diff) + self.values
-        elif width < self.width:
-            self._graphs = [[row[-width:] for row in g] for g in self._graphs]
-            self.values = self.values[-(2 * width + 1) :]
+            values = [None] * (2 * diff) + values
+            columns = [" " * self.height] * (2 * diff) + columns
+        else:
+            values = values[-(2 * width + 1):]
+            columns = columns[len(columns) - 2 * width:]
 
         self.width = width
+        self._values = deque(values, maxlen=2 * width + 1)
+        self._columns = deque(columns, maxlen=2 * width)
+        self._graph = None
 
     def reset_height(self, height: int):
         if height == self.height:
             return
 
-        # recreate both _graphs
+        # recreate the columns from the stored values
         self.height = height
-        blocks = [self.value_to_blocks(value) for value in self.values]
-
-        assert len(self.values) == 2 * self.width + 1
-        g = [
-            # 0 -> 2 * k + 1
-            [
-                [
-                    self.lookup[i0][i1]
-                    for i0, i1 in zip(blocks[2 * k], blocks[2 * k + 1])
-                ]
-                for k in range(self.width)
-            ],
-            # 1 -> 2 * k + 2
-            [
-                [
-                    self.lookup[i0][i1]
-                    for i0, i1 in zip(blocks[2 * k + 1], blocks[2 * k + 2])
-                ]
-                for k in range(self.width)
-            ],
-        ]
-        if not self.flipud:
-            g = [
-                [row[::-1] for row in g[0]],
-                [row[::-1] for row in g[1]],
-            ]
-        # transpose and join
-        self._graphs = [
-            ["".join(row) for row in _transpose(g[0])],
-            ["".join(row) for row in _transpose(g[1])],
-        ]
-        if self.graph_0_is_active:
-            self._graphs = [self._graphs[1], self._graphs[0]]
-
-        self._last_blocks = blocks[-1]
+        self._column_table = _column_table(height, self.flipud)
+        self.set_values(list(self._values))
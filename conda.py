@@ -1,4 +1,9 @@
+from __future__ import annotations
+
 import os
+import re
+import shutil
+from functools import lru_cache
 from platform import python_version
 from typing import List
 
@@ -13,6 +18,72 @@ from textual.layouts.grid import GridLayout
 from textual.reactive import reactive
 
 
+@lru_cache(maxsize=1)
+def conda_info_root() -> str:
+    """`conda info --root`, run once: conda takes about a second to start.
+
+    Raises if conda fails, which lru_cache does not cache.
+    """
+
+    result = subprocess.run(['conda', 'info', '--root'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            check=True)
+    return result.stdout.strip()
+
+
+def get_conda_info_root() -> str:
+    """The cached conda root, or the error to show: conda runs again next time."""
+
+    try:
+        return conda_info_root()
+    except subprocess.CalledProcessError as e:
+        return f"An error occurred: {e.stderr}"
+    except FileNotFoundError:
+        return "Command not found. Please check if the command is installed and in the system PATH."
+
+
+def conda_root_from_environment() -> str | None:
+    """The conda root without running `conda info --root`, e.g. in a sampler tick."""
+
+    conda_exe = os.getenv("CONDA_EXE") or shutil.which("conda")
+    if not conda_exe:
+        return None
+    # <root>/bin/conda or <root>/condabin/conda
+    return os.path.dirname(os.path.dirname(os.path.realpath(conda_exe)))
+
+
+def list_conda_envs(conda_info_root: str) -> list[dict]:
+    """The envs under `conda_info_root`/envs with their prefix and Python version."""
+
+    envs = [f for f in os.listdir(conda_info_root + "/envs") if not f.startswith('.')]
+    envs.sort()
+    # use conda run -n myenv python --version to get python version
+    conda_envs = []
+    for env in envs:
+        # 这种方法太慢了！
+        # python_version = self.run_command([f'{self.conda_info_root}/bin/conda', 'run', '-n', env, 'python', '--version'])
+
+        # 通过 ls envs/env_name/conda-meta/python-3.12.9-*.json文件 来判断python版本为3.12
+        files = os.listdir(conda_info_root + "/envs/" + env + "/conda-meta")
+        # 正则表达式匹配 'python-版本号' 格式
+        pattern = r'python-(\d+\.\d+\.\d+)'
+        # 提取版本号
+        version_numbers = [re.search(pattern, file).group(1) for file in files if re.search(pattern, file)]
+
+        conda_envs.append({
+            "name": f"{env}",
+            "prefix": conda_info_root + "/envs/" + env,
+            "python_version" : version_numbers[0] if version_numbers else ""
+        })
+    return conda_envs
+
+
+@lru_cache(maxsize=1)
+def get_conda_envs(conda_info_root: str) -> list[dict]:
+    """`list_conda_envs` for the panel, cached: the app prefetches it."""
+
+    return list_conda_envs(conda_info_root)
+
+
 class Conda(VerticalScroll):
     conda_prefix = reactive("")
     conda_info_root = reactive("")
@@ -118,38 +189,33 @@ class Conda(VerticalScroll):
         self.text_log = self.query_one("#conda_log")
         self.call_after_refresh(self.update_data)
 
+    def panel_resumed(self) -> None:
+        """The panel is shown again: keep the list, re-list the envs behind it
+        (e.g. created in a terminal meanwhile)."""
+        self.update_data(refresh=True)
+
     @work(exclusive=True, thread=True)
-    def update_data(self):
+    def update_data(self, refresh: bool = False):
         self.update_conda_info_root()
         self.conda_prefix = self._get_conda_prefix()
         self.app.call_from_thread(
             self.query_one("#conda_info_root_label").update,
             f"CONDA_ROOT: {self.conda_info_root}\nCONDA_PREFIX: {self.conda_prefix}"
         )
-        self.update_conda_envs()
+        self.update_conda_envs(refresh)
 
 
-    def update_conda_envs(self):
-        envs = [f for f in os.listdir(self.conda_info_root + "/envs") if not f.startswith('.')]
-        envs.sort()
-        # use conda run -n myenv python --version to get python version
-        self.conda_envs = []
-        for env in envs:
-            # 这种方法太慢了！
-            # python_version = self.run_command([f'{self.conda_info_root}/bin/conda', 'run', '-n', env, 'python', '--version'])
-
-            # 通过 ls envs/env_name/conda-meta/python-3.12.9-*.json文件 来判断python版本为3.12
-            files = os.listdir(self.conda_info_root + "/envs/" + env + "/conda-meta")
-            # 正则表达式匹配 'python-版本号' 格式
-            pattern = r'python-(\d+\.\d+\.\d+)'
-            # 提取版本号
-            import re
-            version_numbers = [re.search(pattern, file).group(1) for file in files if re.search(pattern, file)]
-
-            self.conda_envs.append({
-                "name": f"{env}",
-                "python_version" : version_numbers[0] if version_numbers else ""
-            })
+    def update_conda_envs(self, refresh: bool = False):
+        if refresh:
+            get_conda_envs.cache_clear()
+        if not os.path.isdir(self.conda_info_root + "/envs"):
+            # no conda (the root is the error message) or no envs yet
+            conda_envs = []
+        else:
+            conda_envs = get_conda_envs(self.conda_info_root)
+        if refresh and conda_envs == self.conda_envs:
+            return
+        self.conda_envs = conda_envs
         self.app.call_from_thread(self.query_one(ListView).clear)
         for conda_env in self.conda_envs:
             self.app.call_from_thread(
@@ -162,6 +228,7 @@ class Conda(VerticalScroll):
             # disable button
             event.button.disabled = True
             await self._install_miniconda3_linux()
+            conda_info_root.cache_clear()
             event.button.disabled = False
 
         if event.button.label == "Create New Env":
@@ -185,7 +252,7 @@ class Conda(VerticalScroll):
             "Done.\n"
         )
         event.button.disabled = False
-        self.update_conda_envs()
+        self.update_conda_envs(refresh=True)
 
 
     def on_list_view_selected(self, event: ListView.Selected):
@@ -198,7 +265,7 @@ class Conda(VerticalScroll):
         pass
 
     def update_conda_info_root(self):
-        self.conda_info_root = self.run_command(['conda', 'info', '--root'])
+        self.conda_info_root = get_conda_info_root()
 
     def compose(self) -> ComposeResult:
         yield Label("", id="conda_info_root_label")
@@ -1,8 +1,5 @@
-import asyncio
-
-import psutil
 from rich.console import Group
-from rich.text import Text
+from rich.text import Span, Text
 from textual import events
 from textual._time import time
 from textual.app import ComposeResult, RenderResult
@@ -12,67 +9,112 @@ from textual.renderables.gradient import LinearGradient
 from textual.widget import Widget
 from textual.widgets import Static
 
-from braille_stream import BrailleStream
+from braille_stream import BrailleStream, braille_rows
+from history import ZOOM_LEVELS, format_seconds
+from metrics import CPU as CPU_METRIC, CPU_CORES, CpuCores, MetricsSnapshot
 
 
-class CPU(Widget):
+# per-core heat levels, from idle to busy
+HEAT_CHARS = "▁▂▃▄▅▆▇██"
+HEAT_STYLES = ["grey35", "green4", "green3", "chartreuse3", "yellow3", "gold1", "orange1", "dark_orange", "red1"]
 
-    def __init__(self):
-        super().__init__()
-        self.os_type = self._get_os_type()
-        self.cpu_arch = self._get_cpu_arch()
-        self.hostname = self._get_hostname()
-        self.python_version = self._get_python_version()
-        self.env_hf_endpoint = self._get_env_hf_endpoint()
-        self.env_hf_home = self._get_env_hf_home()
 
-        self.group = Group("")
-        self.braille_stream = BrailleStream(40, 12, 0.0, 100.0)
-
-        # asyncio run get_cpu_usage in background
-        asyncio.create_task(self.get_cpu_usage(1))
+def heatmap(cores: CpuCores, width: int) -> list[Text]:
+    """One cell per core, `width` cores per line, in a single pass."""
 
-    def on_resize(self, event: events.Resize) -> None:
-        self.braille_stream.reset_width(event.size.width - 2)
+    levels = [int(busy * (len(HEAT_CHARS) - 1) / 100 + 0.5) for busy in cores.busy]
+    lines = []
+    for start in range(0, len(levels), max(1, width)):
+        row = levels[start:start + width]
+        spans = []
+        run = 0
+        # one span per run of equal levels
+        for k in range(1, len(row) + 1):
+            if k == len(row) or row[k] != row[run]:
+                spans.append(Span(run, k, HEAT_STYLES[row[run]]))
+                run = k
+        lines.append(Text("".join(HEAT_CHARS[level] for level in row), spans=spans))
+    return lines
 
 
+def load_breakdown(cores: CpuCores) -> Text:
+    count = len(cores.busy) or 1
+    busiest = max(range(len(cores.busy)), key=cores.busy.__getitem__, default=0)
+    return Text.assemble(
+        ("user ", "green"), f"{sum(cores.user) / count:.1f}%  ",
+        ("sys ", "red1"), f"{sum(cores.system) / count:.1f}%  ",
+        ("iowait ", "yellow3"), f"{sum(cores.iowait) / count:.1f}%  ",
+        f"busiest core {busiest}: {cores.busy[busiest] if cores.busy else 0:.0f}%",
+    )
 
-    def _get_cpu_arch(self) -> str:
-        import platform
-        return platform.machine()
 
-    def _get_env_hf_home(self) -> str:
-        import os
-        return os.getenv("HF_HOME")
-
-    def _get_env_hf_endpoint(self) -> str:
-        import os
-        return os.getenv("HF_ENDPOINT")
+class CPU(Widget):
+    # seconds per chart value, a click zooms out to the next one
+    ZOOM_LEVELS = ZOOM_LEVELS
 
-    def _get_python_version(self) -> str:
-        import sys
-        return sys.version.split()[0]
+    def __init__(self):
+        super().__init__()
+        self.group = Group("")
+        self.braille_stream = BrailleStream(40, 12, 0.0, 100.0)
+        self.zoom = 0
+        self.cpu_usage = None
+        self.cpu_cores: CpuCores | None = None
 
-    def _get_hostname(self) -> str:
-        import socket
-        return socket.gethostname()
+    def on_mount(self) -> None:
+        # readings come from the app's shared sampler
+        self.app.metrics.subscribe(self.update_cpu_usage, CPU_METRIC, CPU_CORES, owner=self)
 
-    def _get_os_type(self) -> str:
-        import platform
-        return platform.system().lower()
+    def on_unmount(self) -> None:
+        self.app.metrics.unsubscribe(self.update_cpu_usage)
 
-    async def get_cpu_usage(self, interval):
-        while True:
-            cpu_usage = psutil.cpu_percent()
-            # self.cpu_usage = cpu_usage
-            self.braille_stream.add_value(cpu_usage)
-            val_string = f"Usage {cpu_usage}% "
-            graph = "\n".join(
-                [val_string + self.braille_stream.graph[0][len(val_string):]] + self.braille_stream.graph[1:]
-            )
-            self.group.renderables[0] = Text(graph, style="green")
-            self.refresh()
-            await asyncio.sleep(interval)
+    def on_resize(self, event: events.Resize) -> None:
+        self.braille_stream.reset_width(event.size.width - 2)
+        self.load_history()
+
+    def on_show(self, event: events.Show) -> None:
+        # paused while hidden (see metrics.Subscription): catch up
+        self.load_history()
+
+    def load_history(self) -> None:
+        # start with what was recorded, not an empty chart
+        self.braille_stream.set_values(
+            self.app.metrics_history.values("cpu", 1, 2 * self.braille_stream.width + 1)
+        )
+        self.update_graph()
+
+    def on_click(self, event: events.Click) -> None:
+        self.zoom = (self.zoom + 1) % len(self.ZOOM_LEVELS)
+        self.update_graph()
+
+
+    def update_cpu_usage(self, snapshot: MetricsSnapshot) -> None:
+        self.cpu_usage = snapshot.cpu_percent
+        self.cpu_cores = snapshot.cpu_cores
+        self.braille_stream.add_value(self.cpu_usage)
+        self.update_graph()
+
+    def update_graph(self) -> None:
+        seconds = self.ZOOM_LEVELS[self.zoom]
+        if seconds == 1:
+            rows = self.braille_stream.graph
+        else:
+            # zoomed out: drawn from the history store, peaks of each bucket
+            stream = self.braille_stream
+            values = self.app.metrics_history.zoomed("cpu", seconds, 2 * stream.width + 1, stat="max")
+            rows = braille_rows(values, stream.width, stream.height, stream.minval, stream.maxval)
+
+        val_string = f"Usage {self.cpu_usage}% " if self.cpu_usage is not None else ""
+        if seconds != 1:
+            val_string += f"({format_seconds(seconds)}/dot) "
+        graph = "\n".join([val_string + rows[0][len(val_string):]] + rows[1:])
+        renderables = [Text(graph, style="green")]
+        if self.cpu_cores is not None:
+            renderables += heatmap(self.cpu_cores, self.braille_stream.width)
+            renderables.append(load_breakdown(self.cpu_cores))
+        # height is auto: only lay out again when the heatmap gains a line
+        layout = len(renderables) != len(self.group.renderables)
+        self.group.renderables[:] = renderables
+        self.refresh(layout=layout)
 
     def render(self) -> RenderResult:
         return self.group
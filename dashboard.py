@@ -1,20 +1,19 @@
 from __future__ import annotations
 
-import platform
 from textual import events
 from textual.app import ComposeResult
 from textual.containers import VerticalScroll
 from textual.reactive import reactive
 from textual.widgets import Static
-from cpuinfo import get_cpu_info
 
 from cpu import CPU
 from gpu import GPU
+from host_facts import host_facts
 
 
 class DashBoard(VerticalScroll):
 
-    cpu_usage = reactive(0.0, recompose=True)
+    cpu_usage = reactive(0.0)
     gpu_usage = reactive(0.0)
 
     # on_mount
@@ -25,22 +24,16 @@ class DashBoard(VerticalScroll):
             classes: str | None = None,
     ):
         super().__init__(name=name, id=id, classes=classes)
-        self.os_type = self._get_os_type()
-        self.cpu_arch = self._get_cpu_arch()
-        self.cpu_model = self._get_cpu_model()
-        self.hostname = self._get_hostname()
-        self.python_version = self._get_python_version()
+        # cached, see host_facts.py: no probe runs here
+        facts = host_facts()
+        self.os_type = facts.os_type
+        self.cpu_arch = facts.cpu_arch
+        self.hostname = facts.hostname
+        self.python_version = facts.python_version
         self.env_hf_endpoint = self._get_env_hf_endpoint()
         self.env_hf_home = self._get_env_hf_home()
         self.grabbed = False
 
-    def _get_cpu_arch(self) -> str:
-        return platform.machine()
-
-    def _get_cpu_model(self) -> str:
-        cpuinfo = get_cpu_info()
-        return cpuinfo['brand_raw']
-
     def _get_env_hf_home(self) -> str:
         import os
         return os.getenv("HF_HOME")
@@ -49,18 +42,6 @@ class DashBoard(VerticalScroll):
         import os
         return os.getenv("HF_ENDPOINT")
 
-    def _get_python_version(self) -> str:
-        import sys
-        return sys.version.split()[0]
-
-    def _get_hostname(self) -> str:
-        import socket
-        return socket.gethostname()
-
-    def _get_os_type(self) -> str:
-        import platform
-        return platform.system().lower()
-
     def compose(self) -> ComposeResult:
 
         gpu = GPU()
@@ -81,7 +62,7 @@ HF_HOME: {self.env_hf_home}
         # yield basic_info
 
         cpu = CPU()
-        cpu.border_title=f"CPU - {self.cpu_model}"
+        cpu.border_title = self.cpu_title()
         yield cpu
 
         # mem = Mem()
@@ -98,6 +79,20 @@ HF_HOME: {self.env_hf_home}
         # yield hf
 
 
+    @staticmethod
+    def cpu_title() -> str:
+        # the model is unknown until the first probe on a new boot
+        cpu_model = host_facts().cpu_model
+        return f"CPU - {cpu_model}" if cpu_model else "CPU"
+
+    def set_cpu_title(self) -> None:
+        self.query_one(CPU).border_title = self.cpu_title()
+
+    def panel_resumed(self) -> None:
+        # the charts were paused while the panel was hidden, see PopupScreen
+        self.query_one(CPU).load_history()
+        self.query_one(GPU).load_history()
+
     async def on_mouse_down(self, event: events.MouseDown) -> None:
         self.grabbed = True
         event.stop()
@@ -0,0 +1,141 @@
+"""
+Stand-in for nvidia-smi on machines without an Nvidia GPU.
+
+Answers the queries PaperBrew makes (`--query-gpu`, `--query-compute-apps`)
+with made-up but plausible readings, so the GPU telemetry and the dashboard
+can be exercised anywhere:
+
+    PAPERBREW_NVIDIA_SMI="python fake_nvidia_smi.py" python main.py
+    FAKE_GPUS=8 python fake_nvidia_smi.py --query-gpu=index,name,utilization.gpu --format=csv,nounits -lms 500
+
+FAKE_GPUS sets the number of GPUs (default 2), FAKE_NVIDIA_SMI_ROWS stops a
+looping query after that many samples, e.g. to check that the stream is
+restarted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import sys
+import time
+
+GPU_NAME = "NVIDIA A100-SXM4-80GB"
+MEMORY_TOTAL = 81920
+
+
+def fake_uuid(index: int) -> str:
+    return f"GPU-{index:08x}-fake-0000-0000-000000000000"
+
+
+def app_fields(gpus: int) -> list[dict[str, tuple[str, str]]]:
+    """The compute apps: our parent process (e.g. PaperBrew) on every GPU."""
+
+    pid = str(os.getppid())
+    return [
+        {
+            "pid": ("", pid),
+            "process_name": ("", "python"),
+            "gpu_uuid": ("", fake_uuid(index)),
+            "used_memory": ("MiB", str(1024 * (index + 1))),
+        }
+        for index in range(gpus)
+    ]
+
+
+def gpu_fields(index: int, t: float) -> dict[str, tuple[str, str]]:
+    """Field name -> (unit, value) for GPU `index` at time `t`."""
+
+    # every GPU follows its own slow wave so the charts move
+    load = (math.sin(t / 7 + index) + 1) / 2
+    return {
+        "index": ("", str(index)),
+        "uuid": ("", fake_uuid(index)),
+        "name": ("", GPU_NAME),
+        "temperature.gpu": ("", str(int(35 + 45 * load))),
+        "fan.speed": ("%", str(int(30 + 60 * load))),
+        "power.draw": ("W", f"{60 + 340 * load:.2f}"),
+        "power.limit": ("W", "400.00"),
+        "memory.total": ("MiB", str(MEMORY_TOTAL)),
+        "memory.used": ("MiB", str(int(MEMORY_TOTAL * (0.1 + 0.8 * load)))),
+        "utilization.gpu": ("%", str(int(100 * load))),
+        "compute_mode": ("", "Default"),
+    }
+
+
+def print_query(fields: list[str], rows: list[dict[str, tuple[str, str]]], nounits: bool, header: bool) -> None:
+    if header:
+        print(", ".join(
+            f"{field} [{rows[0][field][0]}]" if rows and rows[0][field][0] else field for field in fields
+        ))
+    for row in rows:
+        values = []
+        for field in fields:
+            unit, value = row[field]
+            values.append(value if nounits or not unit else f"{value} {unit}")
+        print(", ".join(values))
+    sys.stdout.flush()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--query-gpu")
+    parser.add_argument("--query-compute-apps")
+    parser.add_argument("--format", default="csv")
+    parser.add_argument("-lms", type=int)
+    parser.add_argument("-l", type=int)
+    args, _ = parser.parse_known_args()
+    gpus = int(os.getenv("FAKE_GPUS", "2"))
+
+    formats = args.format.split(",")
+    nounits = "nounits" in formats
+    header = "noheader" not in formats
+
+    if args.query_compute_apps is not None:
+        fields = args.query_compute_apps.split(",")
+        rows = app_fields(gpus)
+        unknown = [field for field in fields if field not in app_fields(1)[0]]
+        if unknown:
+            print(f'Field "{unknown[0]}" is not a valid field to query.', file=sys.stderr)
+            return 2
+        print_query(fields, rows, nounits, header)
+        return 0
+
+    if args.query_gpu is None:
+        # plain `nvidia-smi`, used to detect the driver
+        if gpus == 0:
+            print("No devices were found")
+        else:
+            for index in range(gpus):
+                print(f"| {index}  {GPU_NAME}  On |")
+        return 0
+
+    fields = args.query_gpu.split(",")
+    unknown = [field for field in fields if field not in gpu_fields(0, 0)]
+    if unknown:
+        print(f'Field "{unknown[0]}" is not a valid field to query.', file=sys.stderr)
+        return 2
+
+    interval = args.lms / 1000 if args.lms else args.l
+    if not interval:
+        print_query(fields, [gpu_fields(index, time.time()) for index in range(gpus)], nounits, header)
+        return 0
+
+    # like nvidia-smi: the header once, then all GPUs every interval
+    samples = int(os.getenv("FAKE_NVIDIA_SMI_ROWS", "0"))
+    sample = 0
+    try:
+        while True:
+            rows = [gpu_fields(index, time.time()) for index in range(gpus)]
+            print_query(fields, rows, nounits, header and sample == 0)
+            sample += 1
+            if sample == samples:
+                return 0
+            time.sleep(interval)
+    except (KeyboardInterrupt, BrokenPipeError):
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
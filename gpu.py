@@ -1,125 +1,186 @@
-import asyncio
-import json
-
-import subprocess
-from time import sleep
-
-import psutil
 from rich.console import Group
 from rich.text import Text
-from textual import events, work
-from textual.app import ComposeResult, RenderResult
+from textual import events
+from textual.app import RenderResult
 from textual.containers import Container
 from textual.reactive import reactive
 from textual.renderables.gradient import LinearGradient
 from textual.widget import Widget
-from textual.widgets import Static, Label, Log
+from textual.widgets import Static, Label
+
+from braille_stream import BrailleStream, braille_rows
+from gpu_telemetry import GpuProcess, to_float
+from history import ZOOM_LEVELS, MetricsHistory, format_seconds
+from metrics import GPU_PROCESSES, GPUS, MetricsSnapshot
+
+# width of the "UTIL   97%" labels in front of the charts
+LABEL_WIDTH = 18
+# the processes using the most GPU memory are listed
+MAX_PROCESSES = 10
+
+
+class GpuHistory:
+    """Utilization, memory and power history of one GPU."""
+
+    def __init__(self, width: int):
+        self.utilization = BrailleStream(width, 1, 0.0, 100.0)
+        self.memory = BrailleStream(width, 1, 0.0, 1.0)
+        self.power = BrailleStream(width, 1, 0.0, 1.0)
+
+    def reset_width(self, width: int) -> None:
+        for stream in (self.utilization, self.memory, self.power):
+            stream.reset_width(width)
 
-from braille_stream import BrailleStream
+    def load(self, metrics_history: MetricsHistory, index: str, end: float | None = None) -> None:
+        """Fills the charts with the recorded history of GPU `index` up to `end`."""
+
+        for stream, series in ((self.utilization, "utilization"), (self.memory, "memory"), (self.power, "power")):
+            stream.set_values(metrics_history.values(f"gpu{index}.{series}", 1, 2 * stream.width + 1, end))
+
+    def graph(self, metrics_history: MetricsHistory, index: str, series: str, seconds: int) -> str:
+        """The chart of `series` at `seconds` per value, from the history when zoomed out."""
+
+        stream = getattr(self, series)
+        if seconds == 1:
+            return stream.graph[0]
+        values = metrics_history.zoomed(f"gpu{index}.{series}", seconds, 2 * stream.width + 1, stat="max")
+        return braille_rows(values, stream.width, stream.height, stream.minval, stream.maxval)[0]
+
+    def set_limits(self, gpu_info_dict: dict[str, str]) -> None:
+        memory_total = to_float(gpu_info_dict.get("memory.total [MiB]"))
+        if memory_total:
+            self.memory.maxval = memory_total
+        power_limit = to_float(gpu_info_dict.get("power.limit [W]"))
+        if power_limit:
+            self.power.maxval = power_limit
+
+    def add_row(self, gpu_info_dict: dict[str, str]) -> None:
+        self.set_limits(gpu_info_dict)
+        # "[N/A]" counters are gaps
+        self.utilization.add_value(to_float(gpu_info_dict.get("utilization.gpu [%]")))
+        self.memory.add_value(to_float(gpu_info_dict.get("memory.used [MiB]")))
+        self.power.add_value(to_float(gpu_info_dict.get("power.draw [W]")))
 
 
 class GPU(Widget):
 
     def __init__(self):
         super().__init__()
-        self.os_type = self._get_os_type()
-        self.cpu_arch = self._get_cpu_arch()
-
-    def _get_cpu_arch(self) -> str:
-        import platform
-        return platform.machine()
-
-    def _get_os_type(self) -> str:
-        import platform
-        return platform.system().lower()
+        self.group = Group("Loading...")
+        self.chart_width = 40
+        self._lines = 1
+        self.zoom = 0
+        self.snapshot: MetricsSnapshot | None = None
+        # keyed by the GPU index
+        self.histories: dict[str, GpuHistory] = {}
 
     def on_mount(self) -> None:
-        self.call_after_refresh(self.start_gpu_monitor)
-
-    def start_gpu_monitor(self):
-        if self.os_type == "darwin":
-            self.get_macmon_output(3)
-        elif self.is_nvidia_smi_installed:
-            self.get_nvidia_smi_output(3)
-
-    @work(exclusive=True, thread=True)
-    def is_nvidia_smi_installed(self) -> bool:  # 检测是否有nvidia-smi命令
-        if self.os_type == "linux" and self.cpu_arch == "x86_64":
-            try:
-                result = subprocess.run(["nvidia-smi"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                                        check=True)
-                # 返回标准输出
-                output = result.stdout.strip()
-                if output.__contains__("No devices were found"):
-                    return False
-                return True
-            except subprocess.CalledProcessError:
-                print("nvidia-smi command not found")
-                return False
+        # readings come from the app's shared sampler
+        self.app.metrics.subscribe(self.update_gpu_info, GPUS, GPU_PROCESSES, owner=self)
+
+    def on_unmount(self) -> None:
+        self.app.metrics.unsubscribe(self.update_gpu_info)
+
+    def on_resize(self, event: events.Resize) -> None:
+        self.chart_width = max(1, event.size.width - LABEL_WIDTH)
+        for index, history in self.histories.items():
+            history.reset_width(self.chart_width)
+            history.load(self.app.metrics_history, index)
+
+    def on_show(self, event: events.Show) -> None:
+        # paused while hidden (see metrics.Subscription): catch up
+        self.load_history()
+
+    def load_history(self) -> None:
+        for index, history in self.histories.items():
+            history.load(self.app.metrics_history, index)
+        if self.snapshot is not None:
+            self.draw(self.snapshot)
+
+    def on_click(self, event: events.Click) -> None:
+        self.zoom = (self.zoom + 1) % len(ZOOM_LEVELS)
+        seconds = ZOOM_LEVELS[self.zoom]
+        self.border_subtitle = f"{format_seconds(seconds)}/dot" if seconds != 1 else ""
+        if self.snapshot is not None:
+            self.draw(self.snapshot)
+
+    def update_gpu_info(self, snapshot: MetricsSnapshot) -> None:
+        self.snapshot = snapshot
+        if snapshot.gpus and snapshot.gpu_backend == "macmon":
+            gpu_info_dict = snapshot.gpus[0]
+            self.history("0", gpu_info_dict, snapshot).utilization.add_value(to_float(gpu_info_dict["usage"]))
+        elif snapshot.gpus:
+            for k, gpu_info_dict in enumerate(snapshot.gpus):
+                self.history(gpu_info_dict.get("index", str(k)), gpu_info_dict, snapshot).add_row(gpu_info_dict)
+        self.draw(snapshot)
+
+    def draw(self, snapshot: MetricsSnapshot) -> None:
+        # all GPUs go into one Text and one refresh per tick
+        text = Text(no_wrap=True, overflow="crop")
+        if not snapshot.gpus:
+            text.append(snapshot.gpu_error or "Loading...")
+        elif snapshot.gpu_backend == "macmon":
+            gpu_info_dict = snapshot.gpus[0]
+            text.append(f"{"Frequency:":<12} {gpu_info_dict['frequency']}MHz\n")
+            self.append_chart(text, f"{"Usage:":<12} {gpu_info_dict['usage']}%", "0", "utilization", "green")
         else:
-            print("Unsupported OS or CPU architecture")
-            return False
-
-    def csv_str_to_dict(self, csv_str):
-        # 将CSV字符串分割成行
-        lines = csv_str.strip().split('\n')
-
-        # 获取标题行和值行
-        headers = lines[0].split(', ')
-        values = lines[1].split(', ')
-
-        # 将标题和值组合成字典
-        gpu_dict = {}
-        for header, value in zip(headers, values):
-            gpu_dict[header] = value
-
-        return gpu_dict
-
-
-    @work(exclusive=True, thread=True)
-    def get_macmon_output(self, interval):
-        while True:
-            try:
-                result = subprocess.run(["macmon", "pipe", "-s", "1"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-                # parse json
-                json_result = json.loads(result.stdout)
-                self.app.call_from_thread(self.query_one(Log).clear)
-                self.app.call_from_thread(self.query_one(Log).write_line, f"{"Frequency:":<12} {json_result['gpu_usage'][0]}MHz")
-                self.app.call_from_thread(self.query_one(Log).write_line, f"{"Usage:":<12} {json_result['gpu_usage'][1]* 100:.0f}%")
-                sleep(1)
-            except Exception as e:
-                self.app.call_from_thread(self.query_one(Log).clear)
-                self.app.call_from_thread(self.query_one(Log).write_line, "CPU Monitor relies on macmon.")
-                self.app.call_from_thread(self.query_one(Log).write_line, "Run 'brew install macmon' to install it.")
-                print(f"An unexpected error occurred: {e}")
-                break
-
-    @work(exclusive=True, thread=True)
-    def get_nvidia_smi_output(self, interval):
-        while True:
-            try:
-                # run nvidia-smi command
-                csv_result = subprocess.run(["nvidia-smi",
-                                             "--query-gpu=name,temperature.gpu,fan.speed,power.draw,power.limit,memory.total,memory.used,utilization.gpu,compute_mode",
-                                             "--format=csv,nounits"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                            text=True, check=True)
-                # 整理为Python字典
-                gpu_info_dict = self.csv_str_to_dict(csv_result.stdout)
-                self.app.call_from_thread(self.query_one(Log).clear)
-                self.app.call_from_thread(self.query_one(Log).write, f"{gpu_info_dict["name"]}\n\n")
-                self.app.call_from_thread(self.query_one(Log).write, f"Usage: {gpu_info_dict["utilization.gpu [%]"]}%\n")
-                self.app.call_from_thread(self.query_one(Log).write, f"TEMP: {gpu_info_dict["temperature.gpu"]}C\n")
-                self.app.call_from_thread(self.query_one(Log).write, f"FAN: {gpu_info_dict["fan.speed [%]"]}%\n")
-                self.app.call_from_thread(self.query_one(Log).write,
-                    f"POWER: {gpu_info_dict["power.draw [W]"]}W / {gpu_info_dict["power.limit [W]"]}W\n")
-                self.app.call_from_thread(self.query_one(Log).write,
-                    f"MEM: {gpu_info_dict["memory.used [MiB]"]}MiB / {gpu_info_dict["memory.total [MiB]"]}MiB\n")
-                sleep(1)
-            except Exception as e:
-                self.app.call_from_thread(self.query_one(Log).clear)
-                self.app.call_from_thread(self.query_one(Log).write_line, "Nvidia GPU not detected")
-                print(f"An unexpected error occurred: {e}")
-                break
-
-    def compose(self) -> ComposeResult:
-        yield Log(id="gpu_log")
+            for k, gpu_info_dict in enumerate(snapshot.gpus):
+                self.append_gpu(text, gpu_info_dict, gpu_info_dict.get("index", str(k)))
+            if snapshot.gpu_processes:
+                self.append_processes(text, snapshot.gpu_processes)
+
+        text.rstrip()
+        self.group.renderables[0] = text
+        # the height only changes when GPUs come or go
+        lines = text.plain.count("\n") + 1
+        self.refresh(layout=lines != self._lines)
+        self._lines = lines
+
+    def history(self, index: str, gpu_info_dict: dict[str, str], snapshot: MetricsSnapshot) -> GpuHistory:
+        history = self.histories.get(index)
+        if history is None:
+            history = self.histories[index] = GpuHistory(self.chart_width)
+            # the limits first, they scale the recorded values. The history
+            # already holds this snapshot (the recorder runs first): load up
+            # to the second before, the caller adds it.
+            history.set_limits(gpu_info_dict)
+            history.load(self.app.metrics_history, index, snapshot.time - 1)
+        return history
+
+    def append_gpu(self, text: Text, gpu_info_dict: dict[str, str], index: str) -> None:
+        text.append(f"{gpu_info_dict.get("index", "")} {gpu_info_dict["name"]}", style="bold")
+        text.append(
+            f"  TEMP: {gpu_info_dict["temperature.gpu"]}C  FAN: {gpu_info_dict["fan.speed [%]"]}%\n",
+        )
+
+        self.append_chart(text, f"USAGE {gpu_info_dict["utilization.gpu [%]"]:>4}%", index, "utilization", "green")
+
+        memory_used = to_float(gpu_info_dict["memory.used [MiB]"]) or 0.0
+        memory_total = to_float(gpu_info_dict["memory.total [MiB]"]) or 0.0
+        self.append_chart(
+            text, f"MEM {memory_used / 1024:5.1f}/{memory_total / 1024:.0f}GiB", index, "memory", "blue_violet"
+        )
+        self.append_chart(
+            text, f"POWER {gpu_info_dict["power.draw [W]"]:>6}W", index, "power", "orange1"
+        )
+
+    def append_processes(self, text: Text, processes: list[GpuProcess]) -> None:
+        text.append(f"{"PID":<8} {"GPU":>3} {"MEM":>7} {"SM":>4}  {"ENV":<12} {"USER":<10} COMMAND\n", style="bold")
+        for process in processes[:MAX_PROCESSES]:
+            utilization = "-" if process.utilization is None else f"{process.utilization:.0f}%"
+            text.append(
+                f"{process.pid:<8} {process.gpu:>3} {process.used_memory / 1024:>6.1f}G {utilization:>4}  "
+                f"{process.env or "-":<12} {process.user[:10]:<10} "
+            )
+            text.append(f"{process.command}\n", style="dim")
+        if len(processes) > MAX_PROCESSES:
+            text.append(f"... {len(processes) - MAX_PROCESSES} more\n", style="dim")
+
+    def append_chart(self, text: Text, label: str, index: str, series: str, style: str) -> None:
+        text.append(f"{label:<{LABEL_WIDTH}}")
+        graph = self.histories[index].graph(self.app.metrics_history, index, series, ZOOM_LEVELS[self.zoom])
+        text.append(graph, style=style)
+        text.append("\n")
+
+    def render(self) -> RenderResult:
+        return self.group
@@ -0,0 +1,321 @@
+"""
+Nvidia GPU telemetry for the metrics sampler.
+
+NvmlTelemetry reads the counters through NVML when the `nvidia-ml-py`
+bindings are installed. Otherwise NvidiaSmiStream keeps one long-lived
+`nvidia-smi --query-gpu=... -lms <interval>` process running and parses the
+rows it streams, instead of forking nvidia-smi on every tick.
+
+Both return one dict per GPU keyed like the `nvidia-smi --format=csv,nounits`
+header, e.g. {"index": "0", "utilization.gpu [%]": "97", ...}.
+
+PAPERBREW_NVIDIA_SMI overrides the nvidia-smi command, e.g. to run the
+stand-in on machines without a GPU:
+
+    PAPERBREW_NVIDIA_SMI="python fake_nvidia_smi.py" python main.py
+"""
+
+from __future__ import annotations
+
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import NamedTuple
+
+import psutil
+
+from conda import conda_root_from_environment, list_conda_envs
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+NVIDIA_SMI_QUERY = (
+    "index,uuid,name,temperature.gpu,fan.speed,power.draw,power.limit,"
+    "memory.total,memory.used,utilization.gpu,compute_mode"
+)
+
+NVIDIA_SMI_APPS_QUERY = "pid,gpu_uuid,used_memory"
+
+COMPUTE_MODES = {0: "Default", 1: "Exclusive_Thread", 2: "Prohibited", 3: "Exclusive_Process"}
+
+
+def to_float(value: str | None) -> float | None:
+    """nvidia-smi values, None for "[N/A]" and friends."""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def milliwatts(value: int) -> str:
+    return f"{value / 1000:.2f}"
+
+
+def nvidia_smi_command() -> list[str]:
+    return shlex.split(os.getenv("PAPERBREW_NVIDIA_SMI", "nvidia-smi"))
+
+
+class NvidiaSmiStream:
+    """Latest rows of a long-lived `nvidia-smi --query-gpu -lms` process."""
+
+    name = "nvidia-smi"
+    PROCESS_INTERVAL = 5.0
+
+    def __init__(self, interval: float = 1.0, query: str = NVIDIA_SMI_QUERY):
+        self.interval = interval
+        self.query = query
+        self.process: subprocess.Popen | None = None
+        self._rows: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._processes: list[tuple[int, str, float, float | None]] = []
+        self._processes_read_at = float("-inf")
+        # set by close(), a sample still running in a thread must not
+        # start a new process
+        self.closed = False
+
+    def start(self) -> None:
+        self.process = subprocess.Popen(
+            [
+                *nvidia_smi_command(),
+                f"--query-gpu={self.query}",
+                "--format=csv,nounits",
+                "-lms", str(int(self.interval * 1000)),
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        threading.Thread(target=self._read_rows, args=(self.process,), name="nvidia-smi", daemon=True).start()
+
+    def _read_rows(self, process: subprocess.Popen) -> None:
+        headers = None
+        for line in process.stdout:
+            values = line.rstrip("\n").split(", ")
+            if headers is None or values[0] == headers[0]:
+                # the header, nvidia-smi may repeat it
+                headers = values
+                continue
+            row = dict(zip(headers, values))
+            with self._lock:
+                self._rows[row["index"]] = row
+        process.stdout.close()
+
+    def read(self) -> list[dict[str, str]]:
+        with self._lock:
+            if self.closed:
+                return []
+            if self.process is None:
+                self.start()
+            elif self.process.poll() is not None:
+                if not self._rows:
+                    raise RuntimeError(f"nvidia-smi exited with status {self.process.returncode}")
+                # e.g. killed or the driver was reloaded: one new process, not one per tick
+                self.start()
+
+            return [self._rows[index] for index in sorted(self._rows, key=int)]
+
+    def read_processes(self) -> list[tuple[int, str, float, float | None]]:
+        """(pid, GPU index, used MiB, SM %) of the compute processes.
+
+        `--query-compute-apps` cannot be streamed by tick, so it is run at
+        most every PROCESS_INTERVAL seconds and cached in between.
+        """
+
+        now = time.monotonic()
+        # wait for the first rows: they map the GPU uuids to indexes
+        if not self.closed and self._rows and now - self._processes_read_at >= self.PROCESS_INTERVAL:
+            self._processes_read_at = now
+            result = subprocess.run(
+                [
+                    *nvidia_smi_command(),
+                    f"--query-compute-apps={NVIDIA_SMI_APPS_QUERY}",
+                    "--format=csv,noheader,nounits",
+                ],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True,
+            )
+            with self._lock:
+                indexes = {row.get("uuid"): index for index, row in self._rows.items()}
+            self._processes = []
+            for line in result.stdout.splitlines():
+                values = line.split(", ")
+                if len(values) == 3 and values[0].isdigit():
+                    self._processes.append((int(values[0]), indexes.get(values[1], "?"), to_float(values[2]), None))
+
+        return self._processes
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+            process, self.process = self.process, None
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+class NvmlTelemetry:
+    """Reads the counters through NVML, no process is spawned at all."""
+
+    name = "nvml"
+
+    def __init__(self):
+        pynvml.nvmlInit()
+        self._handles = [pynvml.nvmlDeviceGetHandleByIndex(k) for k in range(pynvml.nvmlDeviceGetCount())]
+        self._names = [pynvml.nvmlDeviceGetName(handle) for handle in self._handles]
+        # NVML returns the utilization samples newer than the last timestamp
+        self._last_seen = [0] * len(self._handles)
+
+    @staticmethod
+    def _value(function, handle, *args, convert=str) -> str:
+        try:
+            return convert(function(handle, *args))
+        except pynvml.NVMLError:
+            # what nvidia-smi prints for counters a board does not have
+            return "[N/A]"
+
+    def read(self) -> list[dict[str, str]]:
+        rows = []
+        for index, (handle, name) in enumerate(zip(self._handles, self._names)):
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            rows.append({
+                "index": str(index),
+                "name": name if isinstance(name, str) else name.decode(),
+                "temperature.gpu": self._value(pynvml.nvmlDeviceGetTemperature, handle, pynvml.NVML_TEMPERATURE_GPU),
+                "fan.speed [%]": self._value(pynvml.nvmlDeviceGetFanSpeed, handle),
+                "power.draw [W]": self._value(pynvml.nvmlDeviceGetPowerUsage, handle, convert=milliwatts),
+                "power.limit [W]": self._value(pynvml.nvmlDeviceGetEnforcedPowerLimit, handle, convert=milliwatts),
+                "memory.total [MiB]": str(memory.total // (1024 ** 2)),
+                "memory.used [MiB]": str(memory.used // (1024 ** 2)),
+                "utilization.gpu [%]": str(pynvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                "compute_mode": self._value(pynvml.nvmlDeviceGetComputeMode, handle, convert=COMPUTE_MODES.get),
+            })
+        return rows
+
+    def read_processes(self) -> list[tuple[int, str, float, float | None]]:
+        """(pid, GPU index, used MiB, SM %) of the compute processes."""
+
+        processes = []
+        for index, handle in enumerate(self._handles):
+            utilization = {}
+            try:
+                for sample in pynvml.nvmlDeviceGetProcessUtilization(handle, self._last_seen[index]):
+                    utilization[sample.pid] = sample.smUtil
+                    self._last_seen[index] = max(self._last_seen[index], sample.timeStamp)
+            except pynvml.NVMLError:
+                # not supported by the board, or no new samples
+                pass
+
+            for process in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                used_memory = (process.usedGpuMemory or 0) / (1024 ** 2)
+                processes.append((process.pid, str(index), used_memory, utilization.get(process.pid)))
+        return processes
+
+    def close(self) -> None:
+        pynvml.nvmlShutdown()
+
+
+def open_nvidia_telemetry(interval: float = 1.0) -> NvmlTelemetry | NvidiaSmiStream | None:
+    """Returns the cheapest available backend, None if there is no Nvidia GPU."""
+
+    if pynvml is not None and "PAPERBREW_NVIDIA_SMI" not in os.environ:
+        try:
+            telemetry = NvmlTelemetry()
+            if telemetry._handles:
+                return telemetry
+            telemetry.close()
+        except pynvml.NVMLError:
+            pass
+
+    try:
+        result = subprocess.run(nvidia_smi_command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    if "No devices were found" in result.stdout:
+        return None
+    return NvidiaSmiStream(interval)
+
+
+class GpuProcess(NamedTuple):
+    pid: int
+    gpu: str
+    used_memory: float  # MiB
+    utilization: float | None  # SM %, only NVML reports it
+    user: str
+    command: str
+    env: str | None  # the conda env of the interpreter
+
+
+class GpuProcessTable:
+    """Joins the GPU compute processes with psutil and the conda envs.
+
+    The psutil details of a pid are looked up once and kept while it uses
+    the GPU, the env prefixes are re-listed every ENV_INTERVAL seconds, so a
+    tick only costs the backend query and a few dict lookups.
+    """
+
+    ENV_INTERVAL = 60.0
+
+    def __init__(self):
+        self._details: dict[int, tuple[str, str, str | None]] = {}
+        self._env_prefixes: list[tuple[str, str]] = []
+        self._envs_read_at = float("-inf")
+
+    def update_env_prefixes(self) -> None:
+        self._envs_read_at = time.monotonic()
+        conda_info_root = conda_root_from_environment()
+        if conda_info_root is None:
+            self._env_prefixes = []
+            return
+
+        prefixes = [(conda_info_root, "base")]
+        try:
+            prefixes += [(env["prefix"], env["name"]) for env in list_conda_envs(conda_info_root)]
+        except OSError:
+            pass
+        # the longest prefix wins: envs live inside the root
+        self._env_prefixes = sorted(prefixes, key=lambda prefix: len(prefix[0]), reverse=True)
+        # a new env may claim a running process
+        self._details.clear()
+
+    def env_of(self, executable: str) -> str | None:
+        for prefix, name in self._env_prefixes:
+            if executable.startswith(prefix + os.sep):
+                return name
+        return None
+
+    def details(self, pid: int) -> tuple[str, str, str | None]:
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                user = process.username()
+                command = " ".join(process.cmdline()) or process.name()
+                executable = os.path.realpath(process.exe())
+        except psutil.Error:
+            # gone, or owned by another user in a container
+            return "?", "?", None
+        return user, command, self.env_of(executable)
+
+    def join(self, rows: list[tuple[int, str, float, float | None]]) -> list[GpuProcess]:
+        if time.monotonic() - self._envs_read_at >= self.ENV_INTERVAL:
+            self.update_env_prefixes()
+
+        processes = []
+        for pid, gpu, used_memory, utilization in rows:
+            details = self._details.get(pid)
+            if details is None:
+                details = self._details[pid] = self.details(pid)
+            processes.append(GpuProcess(pid, gpu, used_memory or 0.0, utilization, *details))
+
+        # forget the pids that left the GPU
+        pids = {row[0] for row in rows}
+        for pid in [pid for pid in self._details if pid not in pids]:
+            del self._details[pid]
+
+        processes.sort(key=lambda process: process.used_memory, reverse=True)
+        return processes
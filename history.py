@@ -0,0 +1,208 @@
+"""
+Multi-resolution history of the dashboard metrics, kept on disk.
+
+Every series ("cpu", "memory.used", "gpu0.utilization", ...) is a file of
+fixed-size ring buffers, one per resolution:
+
+    1 s     for an hour
+    10 s    for a day
+    1 min   for a week
+
+Each slot holds the bucket number (time // resolution) it was written for,
+plus the min, sum, max and count of the values that fell into it, so the
+avg is exact at every resolution. Slots are addressed by bucket number, a
+slot whose bucket does not match is a gap (e.g. the app was closed), read
+as None. The files are memory-mapped: writing a sample costs a few struct
+writes and the history survives restarts.
+
+Charts zoom out to ZOOM_LEVELS seconds per value. The levels above a minute
+are read from the 1 min buffers and shrunk with braille_stream.resample.
+"""
+
+from __future__ import annotations
+
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from pathlib import Path
+
+from braille_stream import resample
+from gpu_telemetry import to_float
+
+# (seconds per bucket, buckets)
+RESOLUTIONS = ((1, 3600), (10, 8640), (60, 10080))
+
+MAGIC = b"PBH1"
+HEADER = struct.Struct("<4sI")
+# bucket, min, sum, max, count
+SLOT = struct.Struct("<qdddI4x")
+
+# seconds per chart value, a click on a chart zooms out to the next one
+ZOOM_LEVELS = (1, 10, 60, 600, 3600)
+
+GPU_SERIES = (
+    ("utilization.gpu [%]", "utilization"),
+    ("memory.used [MiB]", "memory"),
+    ("power.draw [W]", "power"),
+)
+
+
+def paperbrew_cache_dir() -> Path:
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "paperbrew"
+
+
+def format_seconds(seconds: int) -> str:
+    """E.g. "10s", "10min", "1h" for the zoom labels."""
+
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}min"
+    return f"{seconds}s"
+
+
+class _Series:
+    """The memory-mapped ring buffers of one series."""
+
+    SIZE = HEADER.size + sum(buckets for _, buckets in RESOLUTIONS) * SLOT.size
+
+    def __init__(self, path: Path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != self.SIZE:
+                # new, or written with other resolutions: start over
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.SIZE)
+            self.map = mmap.mmap(fd, self.SIZE)
+        finally:
+            os.close(fd)
+
+        if HEADER.unpack_from(self.map)[0] != MAGIC:
+            self.map[:] = bytes(self.SIZE)
+            HEADER.pack_into(self.map, 0, MAGIC, SLOT.size)
+
+        self.offsets = []
+        offset = HEADER.size
+        for _, buckets in RESOLUTIONS:
+            self.offsets.append(offset)
+            offset += buckets * SLOT.size
+
+    def add(self, value: float, t: float) -> None:
+        for (seconds, buckets), offset in zip(RESOLUTIONS, self.offsets):
+            bucket = int(t // seconds)
+            position = offset + bucket % buckets * SLOT.size
+            stored, minimum, total, maximum, count = SLOT.unpack_from(self.map, position)
+            if stored == bucket and count:
+                SLOT.pack_into(self.map, position, bucket, min(minimum, value), total + value,
+                               max(maximum, value), count + 1)
+            else:
+                SLOT.pack_into(self.map, position, bucket, value, value, value, 1)
+
+    def values(self, level: int, count: int, end: float, stat: str, default: float | None) -> list[float | None]:
+        seconds, buckets = RESOLUTIONS[level]
+        offset = self.offsets[level]
+        last = int(end // seconds)
+        values = []
+        for bucket in range(last - min(count, buckets) + 1, last + 1):
+            stored, minimum, total, maximum, samples = SLOT.unpack_from(
+                self.map, offset + bucket % buckets * SLOT.size
+            )
+            if stored != bucket or not samples:
+                values.append(default)
+            elif stat == "max":
+                values.append(maximum)
+            elif stat == "min":
+                values.append(minimum)
+            else:
+                values.append(total / samples)
+        return [default] * (count - len(values)) + values
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+
+
+class MetricsHistory:
+    """Records MetricsSnapshots, see the module docstring for the layout."""
+
+    def __init__(self, directory: Path | None = None):
+        self.directory = directory or paperbrew_cache_dir() / "history"
+        self._series: dict[str, _Series] = {}
+        # (name, seconds, count, stat) -> (last bucket read, values)
+        self._zoomed: dict[tuple, tuple[int, list[float | None]]] = {}
+
+    def series(self, name: str) -> _Series:
+        series = self._series.get(name)
+        if series is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            filename = re.sub(r"[^\w.-]", "_", name) + ".bin"
+            series = self._series[name] = _Series(self.directory / filename)
+        return series
+
+    def add(self, name: str, value: float, t: float | None = None) -> None:
+        if value is None or math.isnan(value):
+            return
+        self.series(name).add(value, time.time() if t is None else t)
+
+    def values(
+            self,
+            name: str,
+            seconds: int = 1,
+            count: int = 60,
+            end: float | None = None,
+            stat: str = "avg",
+            default: float | None = None,
+    ) -> list[float | None]:
+        """The last `count` buckets of `seconds` (1, 10 or 60) up to `end`.
+
+        `stat` is "min", "avg" or "max" of each bucket, gaps are `default`.
+        """
+
+        level = [resolution for resolution, _ in RESOLUTIONS].index(seconds)
+        return self.series(name).values(level, count, time.time() if end is None else end, stat, default)
+
+    def zoomed(self, name: str, seconds: int, count: int, stat: str = "avg") -> list[float | None]:
+        """The last `count` values of `seconds` each, `seconds` from ZOOM_LEVELS.
+
+        Above a minute, `count * seconds` of 1 min buckets are read and
+        shrunk to `count` (the max of each value). That is up to a week of
+        buckets, so the result is kept until the next minute.
+        """
+
+        if seconds in (resolution for resolution, _ in RESOLUTIONS):
+            return self.values(name, seconds, count, stat=stat)
+
+        resolution = RESOLUTIONS[-1][0]
+        end = time.time()
+        key = (name, seconds, count, stat)
+        cached = self._zoomed.get(key)
+        if cached is None or cached[0] != int(end // resolution):
+            values = resample(self.values(name, resolution, count * seconds // resolution, end, stat), count)
+            cached = self._zoomed[key] = (int(end // resolution), values)
+        return cached[1]
+
+    def record(self, snapshot) -> None:
+        """Adds the readings of a MetricsSnapshot, a sampler subscriber."""
+
+        t = snapshot.time
+        if snapshot.cpu_percent is not None:
+            self.add("cpu", snapshot.cpu_percent, t)
+        if snapshot.memory is not None:
+            self.add("memory.used", snapshot.memory.used, t)
+            self.add("memory.free", snapshot.memory.free, t)
+        if snapshot.gpus and snapshot.gpu_backend == "macmon":
+            self.add("gpu0.utilization", to_float(snapshot.gpus[0]["usage"]), t)
+        elif snapshot.gpus:
+            for gpu_info_dict in snapshot.gpus:
+                index = gpu_info_dict.get("index", "0")
+                for key, series in GPU_SERIES:
+                    self.add(f"gpu{index}.{series}", to_float(gpu_info_dict.get(key)), t)
+
+    def close(self) -> None:
+        for series in self._series.values():
+            series.close()
+        self._series.clear()
+        self._zoomed.clear()
@@ -0,0 +1,133 @@
+"""
+Facts about the host that do not change while it is up: CPU model, arch,
+hostname, Python version and whether there is a GPU to monitor.
+
+Some of them are slow to find out (cpuinfo may spawn a subprocess, the GPU
+check runs nvidia-smi), so they are kept in a small JSON file keyed on the
+boot ID. The app re-probes them in the background with refresh_host_facts
+only when load_host_facts misses. host_facts() itself never probes anything
+slow: until the first refresh on a new boot, cpu_model and has_gpu are None.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import threading
+from typing import NamedTuple
+
+import psutil
+from cpuinfo import get_cpu_info
+
+from gpu_telemetry import open_nvidia_telemetry
+from history import paperbrew_cache_dir
+
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+
+class HostFacts(NamedTuple):
+    os_type: str
+    cpu_arch: str
+    hostname: str
+    python_version: str
+    cpu_model: str | None = None  # None until probed
+    has_gpu: bool | None = None  # None until probed
+
+
+_facts: HostFacts | None = None
+_lock = threading.Lock()
+
+
+def host_facts_path():
+    return paperbrew_cache_dir() / "host_facts.json"
+
+
+def boot_id() -> str:
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except OSError:
+        # e.g. macOS: the boot time identifies the boot as well
+        return str(psutil.boot_time())
+
+
+def cache_key() -> dict[str, str]:
+    # the interpreter and the nvidia-smi override may differ between runs
+    return {
+        "boot_id": boot_id(),
+        "python": sys.executable,
+        "nvidia_smi": os.getenv("PAPERBREW_NVIDIA_SMI", ""),
+    }
+
+
+def basic_facts() -> HostFacts:
+    """The facts that cost no subprocess."""
+
+    return HostFacts(
+        os_type=platform.system().lower(),
+        cpu_arch=platform.machine(),
+        hostname=socket.gethostname(),
+        python_version=sys.version.split()[0],
+    )
+
+
+def load_host_facts() -> HostFacts | None:
+    try:
+        with open(host_facts_path()) as f:
+            cached = json.load(f)
+        if cached["key"] != cache_key():
+            return None
+        return HostFacts(**cached["facts"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def host_facts() -> HostFacts:
+    """The cached facts, from the disk cache on the first call."""
+
+    global _facts
+    with _lock:
+        if _facts is None:
+            _facts = load_host_facts() or basic_facts()
+        return _facts
+
+
+def probe_cpu_model() -> str | None:
+    return get_cpu_info().get("brand_raw")
+
+
+def probe_gpu(facts: HostFacts) -> bool:
+    if facts.os_type == "darwin":
+        return shutil.which("macmon") is not None
+    if facts.os_type == "linux" and facts.cpu_arch == "x86_64":
+        telemetry = open_nvidia_telemetry()
+        if telemetry is None:
+            return False
+        telemetry.close()
+        return True
+    return False
+
+
+def refresh_host_facts() -> HostFacts:
+    """Probes everything and rewrites the cache. Slow: run it in a worker."""
+
+    global _facts
+    facts = basic_facts()
+    facts = facts._replace(cpu_model=probe_cpu_model(), has_gpu=probe_gpu(facts))
+    with _lock:
+        _facts = facts
+
+    path = host_facts_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write and rename, a reader never sees half a file
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps({"key": cache_key(), "facts": facts._asdict()}))
+        temp.replace(path)
+    except OSError:
+        pass
+    return facts
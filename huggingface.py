@@ -1,6 +1,6 @@
 import os
 
-from textual import on, events
+from textual import on, events, work
 from textual.app import ComposeResult
 from textual.containers import VerticalScroll, HorizontalGroup, VerticalGroup, Container
 from textual.message import Message
@@ -47,10 +47,17 @@ class HuggingFace(VerticalScroll):
         #     event.button.disabled = True
         #     await self._install_miniconda3_linux()
         if event.button.id == "hf_mirror_button":
-            self.post_message(self.SendCommand(f"export HF_MIRROR={self.query_one('#hf_mirrors_select').value}\n"))
+            self.send_command(f"export HF_MIRROR={self.query_one('#hf_mirrors_select').value}\n")
         elif event.button.id == "hf_home_button":
-            self.post_message(self.SendCommand(f"export HF_HOME={self.query_one("#hf_home_input").value}\n"))
+            self.send_command(f"export HF_HOME={self.query_one("#hf_home_input").value}\n")
 
+    @work
+    async def send_command(self, command: str) -> None:
+        message = self.SendCommand(command)
+        self.post_message(message)
+        result = await message.result
+        if result.exit_code:
+            self.notify(f"{result.command.strip()} failed ({result.exit_code})", severity="error")
 
 
     class SendCommand(Message):
@@ -58,6 +65,21 @@ class HuggingFace(VerticalScroll):
         def __init__(self, command: str) -> None:
             super().__init__()
             self.command = command
+            # resolved with the CommandResult once the shell ran the command
+            self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        def track(self, command: asyncio.Future) -> None:
+            """Resolves `result` with the outcome of the running `command`."""
+
+            def done(command: asyncio.Future) -> None:
+                if self.result.done():
+                    return
+                if command.cancelled():
+                    self.result.cancel()
+                else:
+                    self.result.set_result(command.result())
+
+            command.add_done_callback(done)
 
     # @on(Select.Changed)
     # async def select_changed(self, event: Select.Changed) -> None:
@@ -1,20 +1,28 @@
 from __future__ import annotations
 
-from textual import events, log
+import asyncio
+import os
+
+from textual import events, log, work
 from textual.app import ComposeResult, App
 from textual.containers import HorizontalGroup, Grid
 from textual.screen import ModalScreen
 from textual.widget import Widget
-from textual.widgets import Header, Footer, Button, Label
+from textual.widgets import Header, Footer, Button, Label, TabbedContent, TabPane
 
 from dashboard import DashBoard
+from history import MetricsHistory
+from host_facts import load_host_facts, refresh_host_facts
 from huggingface import HuggingFace
 from magic import Magic
+from metrics import CPU, GPUS, MEMORY, MetricsSampler
 from papers import Papers
 from pip import Pip
-from textual_terminal import Terminal
+from shell_integration import bash_command
+from task_inspector import TaskInspector
+from textual_terminal import CommandResult, ShellPool, Terminal
 
-from conda import Conda
+from conda import Conda, get_conda_envs, get_conda_info_root
 
 class QuitScreen(ModalScreen[bool]):  # (1)!
     """Screen with a dialog to quit."""
@@ -39,10 +47,18 @@ class PopupScreen(ModalScreen[bool]):
     def __init__(self, widget: Widget):
         super().__init__()
         self.widget = widget
+        self.shown = False
 
     def compose(self) -> ComposeResult:
         yield self.widget
 
+    def on_screen_resume(self) -> None:
+        # an installed panel is shown again, but Textual only sends Show the
+        # first time: panels with a `panel_resumed()` catch up themselves
+        if self.shown and hasattr(self.widget, "panel_resumed"):
+            self.widget.panel_resumed()
+        self.shown = True
+
     def on_click(self, event: events.Click) -> None:
         # check if mouse click outside the modal
         # then dismiss the modal
@@ -59,11 +75,34 @@ class PaperBrew(App):
     """Paper reproducer app."""
 
     CSS_PATH = "main.tcss"
+    # one terminal tab per session, more can be opened with "New Shell"
+    TERMINAL_SESSIONS = ["train", "monitor", "scratch"]
+    # shells forked ahead of time for new tabs and restarted sessions
+    SHELL_POOL_SIZE = 2
+    # panels opened by the "<name>_button", built once and their screens reused
+    PANELS = {
+        "dashboard": DashBoard,
+        "conda": Conda,
+        "pip": Pip,
+        "huggingface": HuggingFace,
+        "papers": Papers,
+        "tasks": TaskInspector,
+    }
     BINDINGS = [
         ("d", "toggle_dark", "Toggle dark mode"),
         ("q", "request_quit", "Quit"),
     ]
 
+    def __init__(self):
+        super().__init__()
+        # a login bash that reports its prompts and commands (OSC 133)
+        self.terminal_command = bash_command()
+        self.shell_pool = ShellPool(self.terminal_command, size=self.SHELL_POOL_SIZE)
+        # one sampler for every dashboard widget, it runs while any is subscribed
+        self.metrics = MetricsSampler()
+        # charts start from (and zoom out into) the recorded history
+        self.metrics_history = MetricsHistory()
+
     def action_request_quit(self) -> None:
         """Action to display the quit dialog."""
 
@@ -82,17 +121,12 @@ class PaperBrew(App):
 
     async def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "magic_button":
+            # a fresh run every time, not a panel
             await self.push_screen(PopupScreen(Magic(id="magic")))
-        elif event.button.id == "dashboard_button":
-            await self.push_screen(PopupScreen(DashBoard(id="dashboard")))
-        elif event.button.id == "conda_button":
-            await self.push_screen(PopupScreen(Conda(id="conda")))
-        elif event.button.id == "pip_button":
-            await self.push_screen(PopupScreen(Pip(id="pip")))
-        elif event.button.id == "huggingface_button":
-            await self.push_screen(PopupScreen(HuggingFace(id="huggingface")))
-        elif event.button.id == "papers_button":
-            await self.push_screen(PopupScreen(Papers(id="papers")))
+        elif event.button.id.removesuffix("_button") in self.PANELS:
+            await self.push_screen(event.button.id.removesuffix("_button"))
+        elif event.button.id == "new_shell_button":
+            await self.add_session()
 
 
     def compose(self) -> ComposeResult:
@@ -107,18 +141,99 @@ class PaperBrew(App):
             Button("Pip", classes="main_button", id="pip_button"),
             Button("HuggingFace", classes="main_button", id="huggingface_button"),
             Button("Papers", classes="main_button", id="papers_button"),
+            Button("Tasks", classes="main_button", id="tasks_button"),
+            Button("New Shell", classes="main_button", id="new_shell_button"),
         )
 
-        yield Terminal(command=f"bash -rcfile ~/.bashrc -i -l", id="terminal_bash")
+        with TabbedContent(id="terminal_tabs"):
+            for name in self.TERMINAL_SESSIONS:
+                yield self.session_pane(name)
+
+    def session_pane(self, name: str) -> TabPane:
+        """Returns a tab with a terminal session, hidden tabs do not render."""
+
+        return TabPane(
+            name,
+            Terminal(
+                command=self.terminal_command,
+                parse_in_thread=True,
+                pool=self.shell_pool,
+                restart=True,
+                shell_integration=True,
+                id=f"terminal_{name}",
+            ),
+            id=f"session_{name}",
+        )
+
+    async def add_session(self) -> None:
+        tabs: TabbedContent = self.query_one("#terminal_tabs")
+        name = f"shell{tabs.tab_count + 1}"
+        while self.query(f"#session_{name}"):
+            name += "_"
+
+        await tabs.add_pane(self.session_pane(name))
+        self.query_one(f"#terminal_{name}", Terminal).start()
+        tabs.active = f"session_{name}"
+
+    def active_terminal(self) -> Terminal:
+        tabs: TabbedContent = self.query_one("#terminal_tabs")
+        return tabs.active_pane.query_one(Terminal)
 
     async def send_message(self, message: str) -> None:
-        terminal_bash: Terminal = self.query_one("#terminal_bash")
-        await terminal_bash.send_queue.put(["stdin", message])
+        terminal = self.active_terminal()
+        await terminal.send_queue.put(["stdin", message])
+
+    def run_command(self, command: str) -> asyncio.Future[CommandResult]:
+        """Runs `command` in the active shell, await it for the exit status.
+
+        Steps can be chained without sleeping:
+
+            if (await app.run_command("pip install -r requirements.txt")).exit_code == 0:
+                await app.run_command("python train.py")
+        """
+
+        return self.active_terminal().run_command(command)
+
 
+    def on_mount(self) -> None:
+        # installed screens are not removed when dismissed: a panel keeps
+        # its widgets and data between clicks, and its sampler
+        # subscriptions are paused while it is hidden
+        for name, panel in self.PANELS.items():
+            self.install_screen(PopupScreen(panel(id=name)), name=name)
 
     async def on_ready(self) -> None:
-        terminal_bash: Terminal = self.query_one("#terminal_bash")
-        terminal_bash.start()
+        for terminal in self.query(Terminal):
+            terminal.start()
+        self.shell_pool.fill()
+        self.prefetch_panel_data()
+        self.metrics.subscribe(self.metrics_history.record, CPU, MEMORY, GPUS)
+
+    @work(exclusive=True, thread=True)
+    def prefetch_panel_data(self) -> None:
+        """Warms the slow probes the panels run on their first show."""
+
+        # probed once per boot: on a cache miss (a new boot, another Python
+        # or nvidia-smi) the dashboard shows the basic facts until this ends
+        if load_host_facts() is None:
+            refresh_host_facts()
+            self.call_from_thread(self.update_host_facts)
+        conda_info_root = get_conda_info_root()
+        if os.path.isdir(conda_info_root + "/envs"):
+            get_conda_envs(conda_info_root)
+
+    def update_host_facts(self) -> None:
+        for dashboard in self.get_screen("dashboard").query(DashBoard):
+            dashboard.set_cpu_title()
+
+    def on_terminal_started(self, event: Terminal.Started) -> None:
+        self.sub_title = f"{event.terminal.id.removeprefix('terminal_')}: prompt in {event.startup_time * 1000:.0f} ms"
+
+    def on_unmount(self) -> None:
+        self.shell_pool.close()
+        self.metrics.unsubscribe(self.metrics_history.record)
+        self.metrics.close()
+        self.metrics_history.close()
         # await self.send_message("ls\n")
         # await self.send_message("export HF_ENDPOINT=https://hf-mirror.com\n")
         # await self.send_message("echo $HF_ENDPOINT\n")
@@ -130,7 +245,7 @@ class PaperBrew(App):
         )
 
     async def on_hugging_face_send_command(self, event: HuggingFace.SendCommand) -> None:
-        await self.send_message(event.command)
+        event.track(self.run_command(event.command))
 
 
 if __name__ == "__main__":
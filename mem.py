@@ -1,4 +1,3 @@
-import asyncio
 from typing import Union
 
 import psutil
@@ -9,25 +8,43 @@ from textual import events
 from textual._time import time
 from textual.app import ComposeResult, RenderResult
 from textual.containers import Container, VerticalGroup
-from textual.reactive import reactive
 from textual.renderables.gradient import LinearGradient
 from textual.widget import Widget
 from textual.widgets import Static
 
-from braille_stream import BrailleStream
+from braille_stream import BrailleStream, braille_rows
+from history import ZOOM_LEVELS, format_seconds
+from metrics import MEMORY, MetricsSnapshot
 
 class MemChart(Widget):
-    def __init__(self, id, style: Union[str, Style] = ""):
+    def __init__(self, id, series: str, style: Union[str, Style] = ""):
         super().__init__()
         self.id = id
+        # the name in the metrics history
+        self.series = series
         self.style = style
         self.group = Group("")
         mem_total = psutil.virtual_memory().total
         self.braille_stream = BrailleStream(20, 4, 0.0, mem_total)
+        # seconds per value, zoomed out charts are drawn from the history
+        self.seconds = 1
+
+    def load(self, values):
+        self.braille_stream.set_values(values)
+        self.draw()
 
     def write(self, mem_used):
         self.braille_stream.add_value(mem_used)
-        self.group.renderables[0] = Text("\n".join(self.braille_stream.graph), style=self.style)
+        self.draw()
+
+    def draw(self):
+        stream = self.braille_stream
+        if self.seconds == 1:
+            rows = stream.graph
+        else:
+            values = self.app.metrics_history.zoomed(self.series, self.seconds, 2 * stream.width + 1)
+            rows = braille_rows(values, stream.width, stream.height, stream.minval, stream.maxval)
+        self.group.renderables[0] = Text("\n".join(rows), style=self.style)
         self.refresh()
 
     def render(self) -> RenderResult:
@@ -36,43 +53,63 @@ class MemChart(Widget):
 
 
 class Mem(VerticalGroup):
-    total_gb = reactive(1.0, recompose=True)
-    used_gb = reactive(1.0, recompose=True)
-    free_gb = reactive(1.0, recompose=True)
 
     def __init__(self):
         super().__init__()
+        self.total_gb = 1.0
+        self.used_gb = 1.0
+        self.free_gb = 1.0
         self.mem_chart_used = None
         self.mem_chart_free = None
+        self.zoom = 0
+
+    def update_mem_usage(self, snapshot: MetricsSnapshot) -> None:
+        # one virtual_memory() reading per tick, shared by all subscribers
+        memory = snapshot.memory
+        self.mem_chart_used.write(memory.used)
+        self.mem_chart_free.write(memory.free)
+
+        self.total_gb = memory.total / (1024 ** 3)
+        self.used_gb = memory.used / (1024 ** 3)
+        self.free_gb = memory.free / (1024 ** 3)
+        # the labels are updated in place, one line each: no layout needed
+        self.query_one("#mem_total", Static).update(f"Total:  {self.total_gb:0f}GB", layout=False)
+        self.query_one("#mem_used", Static).update(f"Used:  {self.used_gb:0f}GB", layout=False)
+        self.query_one("#mem_free", Static).update(f"Free:  {self.free_gb:0f}GB", layout=False)
 
-    async def get_mem_usage(self, interval):
-        while True:
-            self.mem_chart_used.write(psutil.virtual_memory().used)
-            self.mem_chart_free.write(psutil.virtual_memory().free)
+    async def on_mount(self, event: events.Mount) -> None:
+        self.mem_chart_used = self.query_exactly_one("#mem_chart_used")
+        self.mem_chart_free = self.query_exactly_one("#mem_chart_free")
+        self.load_history()
+        self.app.metrics.subscribe(self.update_mem_usage, MEMORY, owner=self)
 
-            total = psutil.virtual_memory().total
-            self.total_gb = total / (1024 ** 3)
-            used = psutil.virtual_memory().used
-            self.used_gb = used / (1024 ** 3)
-            free = psutil.virtual_memory().free
-            self.free_gb = free / (1024 ** 3)
+    def on_show(self, event: events.Show) -> None:
+        # paused while hidden (see metrics.Subscription): catch up
+        self.load_history()
 
+    def load_history(self) -> None:
+        for chart in (self.mem_chart_used, self.mem_chart_free):
+            chart.load(self.app.metrics_history.values(chart.series, 1, 2 * chart.braille_stream.width + 1))
 
-            await asyncio.sleep(interval)
+    def on_click(self, event: events.Click) -> None:
+        self.zoom = (self.zoom + 1) % len(ZOOM_LEVELS)
+        seconds = ZOOM_LEVELS[self.zoom]
+        self.border_subtitle = f"{format_seconds(seconds)}/dot" if seconds != 1 else ""
+        for chart in (self.mem_chart_used, self.mem_chart_free):
+            chart.seconds = seconds
+            chart.draw()
 
-    async def on_mount(self, event: events.Mount) -> None:
-        self.mem_chart_used = self.query_exactly_one("#mem_chart_used")
-        self.mem_chart_free = self.query_exactly_one("#mem_chart_free")
-        asyncio.create_task(self.get_mem_usage(1))
+    def on_unmount(self) -> None:
+        self.app.metrics.unsubscribe(self.update_mem_usage)
 
     def compose(self):
         yield VerticalGroup(
-         Static(f"Total:  {self.total_gb:0f}GB"),
+         Static(f"Total:  {self.total_gb:0f}GB", id="mem_total"),
 
-         Static(f"Used:  {self.used_gb:0f}GB"),
-         MemChart(id="mem_chart_used", style="blue_violet"),
+         Static(f"Used:  {self.used_gb:0f}GB", id="mem_used"),
+         MemChart(id="mem_chart_used", series="memory.used", style="blue_violet"),
 
-         Static(f"Free:  {self.free_gb:0f}GB"),
-         MemChart(id="mem_chart_free", style="orange1"),
+         Static(f"Free:  {self.free_gb:0f}GB", id="mem_free"),
+         MemChart(id="mem_chart_free", series="memory.free", style="orange1"),
         )
         #https://github.com/Textualize/rich/blob/863d3daa54565cd169139616b71ab4bd8548e3ec/docs/source/appendix/colors.rst
\ No newline at end of file
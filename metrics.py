@@ -0,0 +1,315 @@
+"""
+Shared metrics sampling for the dashboard widgets.
+
+One MetricsSampler per app reads psutil and the GPU telemetry (see
+gpu_telemetry.py) once per tick and publishes the result as a
+MetricsSnapshot to every subscriber. Only the metrics somebody subscribed to
+are sampled, and the cost of a tick does not depend on how many widgets (or
+dashboards) are showing them. Widgets that are not shown are skipped, see
+Subscription.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from array import array
+import subprocess
+import time
+from typing import Any, Callable, NamedTuple
+
+import psutil
+from textual import log
+from textual.widget import Widget
+
+from gpu_telemetry import GpuProcess, GpuProcessTable, NvidiaSmiStream, NvmlTelemetry, open_nvidia_telemetry
+from host_facts import host_facts
+
+CPU = "cpu"
+CPU_CORES = "cpu_cores"
+MEMORY = "memory"
+DISKS = "disks"
+GPUS = "gpus"
+GPU_PROCESSES = "gpu_processes"
+
+# psutil.cpu_times fields that are not busy time of a core
+IDLE_CPU_TIMES = {"idle", "iowait", "guest", "guest_nice"}
+
+
+class CpuCores(NamedTuple):
+    """Per-core percentages of one tick, one array item per core."""
+
+    busy: array
+    user: array
+    system: array
+    iowait: array  # zeros where the OS does not report it
+
+
+class MetricsSnapshot(NamedTuple):
+    """The readings of one tick, None for metrics nobody subscribed to."""
+
+    time: float
+    cpu_percent: float | None = None
+    cpu_cores: CpuCores | None = None
+    memory: Any = None  # psutil.virtual_memory()
+    disks: list[dict] | None = None
+    gpus: list[dict[str, str]] | None = None
+    gpu_backend: str | None = None  # "nvml", "nvidia-smi", "macmon" or None
+    gpu_error: str | None = None
+    gpu_processes: list[GpuProcess] | None = None
+
+
+class Subscription:
+    """A sampler subscriber, as listed by the task inspector.
+
+    A subscription with an `owner` widget is paused while the widget is not
+    on the current screen (e.g. a hidden panel, or scrolled out of view) and
+    dropped once the widget is detached, should it miss its unsubscribe.
+    Subscriptions without an owner, like the history recorder, always run.
+    """
+
+    def __init__(self, callback: Callable[[MetricsSnapshot], None], metrics: frozenset[str], owner: Widget | None):
+        self.callback = callback
+        self.metrics = metrics
+        self.owner = owner
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    @property
+    def name(self) -> str:
+        if self.owner is None:
+            return self.callback.__qualname__
+        return type(self.owner).__name__ + (f"#{self.owner.id}" if self.owner.id else "")
+
+    @property
+    def detached(self) -> bool:
+        return self.owner is not None and not self.owner.is_attached
+
+    @property
+    def active(self) -> bool:
+        if self.owner is None:
+            return True
+        return self.owner.is_attached and self.owner.screen.is_current and self.owner.is_on_screen
+
+    def __call__(self, snapshot: MetricsSnapshot) -> None:
+        started = time.perf_counter()
+        self.callback(snapshot)
+        self.last_time = time.perf_counter() - started
+        self.total_time += self.last_time
+        self.calls += 1
+
+
+class MetricsSampler:
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.snapshot: MetricsSnapshot | None = None
+        self._subscribers: dict[Callable[[MetricsSnapshot], None], Subscription] = {}
+        self._task: asyncio.Task | None = None
+        # seconds spent reading each metric in the last tick that sampled it
+        self.sample_times: dict[str, float] = {}
+        self.tick_time = 0.0
+
+        facts = host_facts()
+        self.os_type = facts.os_type
+        self.cpu_arch = facts.cpu_arch
+        self._gpu: NvmlTelemetry | NvidiaSmiStream | None = None
+        self._gpu_backend: str | None = None
+        self._gpu_error: str | None = None
+        self._gpu_detected = False
+        self._gpu_processes = GpuProcessTable()
+
+    @property
+    def subscriptions(self) -> list[Subscription]:
+        return list(self._subscribers.values())
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def subscribe(
+            self,
+            callback: Callable[[MetricsSnapshot], None],
+            *metrics: str,
+            owner: Widget | None = None,
+    ) -> None:
+        """Calls `callback(snapshot)` on every tick with the given `metrics`.
+
+        Widgets pass themselves as `owner`: they are only called (and their
+        metrics only sampled) while they are shown.
+        """
+
+        self._subscribers[callback] = Subscription(callback, frozenset(metrics), owner)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, callback: Callable[[MetricsSnapshot], None]) -> None:
+        self._subscribers.pop(callback, None)
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.close()
+
+    def close(self) -> None:
+        """Stops the GPU telemetry, it is reopened by the next subscriber."""
+
+        if self._gpu is not None:
+            self._gpu.close()
+            self._gpu = None
+            self._gpu_detected = False
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                started = time.monotonic()
+                for subscription in self.subscriptions:
+                    if subscription.detached:
+                        self.unsubscribe(subscription.callback)
+                if self._task is None:
+                    # the last subscriber was detached
+                    return
+
+                active = [subscription for subscription in self.subscriptions if subscription.active]
+                metrics = frozenset().union(*(subscription.metrics for subscription in active))
+                if metrics:
+                    # psutil and the GPU tools may block: sample in a thread
+                    self.snapshot = await asyncio.to_thread(self.sample, metrics)
+                    for subscription in active:
+                        # skip callbacks that unsubscribed meanwhile (e.g. a
+                        # popup was closed)
+                        if self._subscribers.get(subscription.callback) is not subscription:
+                            continue
+                        # a broken subscriber must not stop the others
+                        try:
+                            subscription(self.snapshot)
+                        except Exception as e:
+                            log.error(f"metrics subscriber {subscription.name} failed: {e!r}")
+                self.tick_time = time.monotonic() - started
+                await asyncio.sleep(max(0.0, self.interval - self.tick_time))
+        except asyncio.CancelledError:
+            pass
+
+    def sample(self, metrics: frozenset[str]) -> MetricsSnapshot:
+        """Reads every metric in `metrics` once."""
+
+        values = {}
+        for metric in (CPU, CPU_CORES, MEMORY, DISKS, GPUS, GPU_PROCESSES):
+            if metric not in metrics:
+                continue
+            started = time.perf_counter()
+            # a metric that fails is None in this tick, the others still count
+            try:
+                if metric == CPU:
+                    values["cpu_percent"] = psutil.cpu_percent()
+                elif metric == CPU_CORES:
+                    values["cpu_cores"] = self.sample_cpu_cores()
+                elif metric == MEMORY:
+                    values["memory"] = psutil.virtual_memory()
+                elif metric == DISKS:
+                    values["disks"] = self.sample_disks()
+                elif metric == GPUS:
+                    values["gpus"] = self.sample_gpus()
+                    values["gpu_backend"] = self._gpu_backend
+                    values["gpu_error"] = self._gpu_error
+                else:
+                    values["gpu_processes"] = self.sample_gpu_processes()
+            except Exception as e:
+                log.warning(f"sampling {metric} failed: {e!r}")
+            self.sample_times[metric] = time.perf_counter() - started
+
+        return MetricsSnapshot(time=time.time(), **values)
+
+    @staticmethod
+    def sample_cpu_cores() -> CpuCores:
+        # one /proc/stat read for every core and every field
+        cores = CpuCores(array("f"), array("f"), array("f"), array("f"))
+        for times in psutil.cpu_times_percent(percpu=True):
+            fields = times._asdict()
+            iowait = fields.get("iowait", 0.0)
+            # the fields do not always add up to 100: sum the busy ones
+            # (guest time is already part of user)
+            busy = sum(value for field, value in fields.items() if field not in IDLE_CPU_TIMES)
+            cores.busy.append(min(100.0, busy))
+            cores.user.append(times.user)
+            cores.system.append(times.system)
+            cores.iowait.append(iowait)
+        return cores
+
+    def sample_disks(self) -> list[dict]:
+        disk_space_info = []
+        for partition in psutil.disk_partitions():
+            usage = psutil.disk_usage(partition.mountpoint)
+            disk_space_info.append({
+                "mountpoint": partition.mountpoint,
+                "device": partition.device,
+                'total': usage.total,
+                'used': usage.used,
+                'free': usage.free,
+                'percent': usage.percent,
+                'total_gb': usage.total / (1024 ** 3),
+                'used_gb': usage.used / (1024 ** 3),
+                'free_gb': usage.free / (1024 ** 3),
+            })
+        return disk_space_info
+
+    def detect_gpu_backend(self) -> None:
+        self._gpu_detected = True
+        self._gpu_backend = self._gpu_error = None
+        if self.os_type == "darwin":
+            self._gpu_backend = "macmon"
+        elif self.os_type == "linux" and self.cpu_arch == "x86_64":
+            # skip running nvidia-smi when this boot is known to have no GPU
+            if host_facts().has_gpu is not False:
+                self._gpu = open_nvidia_telemetry(self.interval)
+            if self._gpu is None:
+                self._gpu_error = "Nvidia GPU not detected"
+            else:
+                self._gpu_backend = self._gpu.name
+        else:
+            self._gpu_error = "Unsupported OS or CPU architecture"
+
+    def sample_gpus(self) -> list[dict[str, str]] | None:
+        if not self._gpu_detected:
+            self.detect_gpu_backend()
+
+        # close() may run on the event loop while this runs in a thread
+        gpu = self._gpu
+        try:
+            if gpu is not None:
+                return gpu.read()
+            if self._gpu_backend == "macmon":
+                result = subprocess.run(["macmon", "pipe", "-s", "1"], stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, check=True)
+                json_result = json.loads(result.stdout)
+                return [{
+                    "frequency": str(json_result['gpu_usage'][0]),
+                    "usage": f"{json_result['gpu_usage'][1] * 100:.0f}",
+                }]
+        except Exception as e:
+            if gpu is not None and gpu is not self._gpu:
+                # closed meanwhile, not a broken backend
+                return None
+            log.warning(f"GPU sampling failed: {e}")
+            if self._gpu_backend == "macmon":
+                self._gpu_error = "CPU Monitor relies on macmon.\nRun 'brew install macmon' to install it."
+            else:
+                self._gpu_error = "Nvidia GPU not detected"
+            # stop polling a tool that does not work (until the next subscriber)
+            self.close()
+            self._gpu_detected = True
+            self._gpu_backend = None
+
+        return None
+
+    def sample_gpu_processes(self) -> list[GpuProcess] | None:
+        if not self._gpu_detected:
+            self.detect_gpu_backend()
+        gpu = self._gpu
+        if gpu is None:
+            return None
+
+        try:
+            return self._gpu_processes.join(gpu.read_processes())
+        except Exception as e:
+            log.warning(f"GPU process sampling failed: {e}")
+            return None
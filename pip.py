@@ -14,6 +14,8 @@ import subprocess
 from textual.layouts.grid import GridLayout
 from textual.reactive import reactive
 
+from conda import get_conda_info_root
+
 class PipPackageListView(Widget):
     pip_packages = reactive([], recompose=True)
 
@@ -58,7 +60,7 @@ class Pip(VerticalScroll):
         self.query_one("#pip_mirrors_select", Select).value = pip_mirror
 
 
-        conda_info_root = self.run_command(['conda', 'info', '--root'])
+        conda_info_root = get_conda_info_root()
         conda_envs = [f for f in os.listdir(conda_info_root + "/envs") if not f.startswith('.')]
         conda_envs.sort()
         conda_env_select = self.query_one("#conda_env_select", Select)
@@ -0,0 +1,271 @@
+"""
+Scrollback history for the terminal emulator.
+
+Lines that scroll off the top of the pyte screen are stored as plain text
+plus run-length style spans. Every `block_size` lines the current block is
+frozen and (optionally) zlib-compressed, and the oldest blocks are dropped
+once `max_lines` is exceeded, so memory stays flat however long the shell
+keeps printing.
+"""
+
+from __future__ import annotations
+
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
+from pyte.screens import Char
+
+# style id 0 is the default pyte style, see Scrollback.style_id()
+DEFAULT_STYLE_KEY = ("default", "default", False, False, False, False, False, False)
+MAX_STYLES = 65536
+
+
+class HistoryLine(NamedTuple):
+    """One line of the history: its text and (length, style key) runs."""
+
+    text: str
+    spans: tuple[tuple[int, tuple], ...]
+
+
+class _Block:
+    """A run of history lines.
+
+    `text` holds the lines joined by newlines, `offsets` the start of each
+    line in `text` (plus the end), `spans` the flattened (length, style id)
+    pairs and `span_offsets` the first pair of each line.
+    """
+
+    __slots__ = ("lines", "text", "offsets", "spans", "span_offsets", "compressed")
+
+    def __init__(self) -> None:
+        self.lines = 0
+        self.text: list[str] | bytes = []
+        self.offsets = array("I", [0])
+        self.spans = array("H")
+        self.span_offsets = array("I", [0])
+        self.compressed = False
+
+    def freeze(self, compress: bool) -> None:
+        text = "\n".join(self.text)
+        if compress:
+            self.text = zlib.compress(text.encode(), 1)
+            self.spans = zlib.compress(self.spans.tobytes(), 1)
+            self.compressed = True
+        else:
+            self.text = text.encode()
+
+
+class _DecodedBlock(NamedTuple):
+    text: str
+    lower: str
+    offsets: array
+    spans: array
+    span_offsets: array
+    # line offsets in `lower`, str.lower() may change the length
+    lower_offsets: array
+
+
+def _lower(text: str, offsets: array) -> tuple[str, array]:
+    """`text` lowercased, with the line offsets of the lowercased text."""
+
+    lower = text.lower()
+    # lowercasing only ever adds code points (e.g. "İ" becomes "i̇"): the
+    # same length means every line kept its length
+    if len(lower) == len(text):
+        return lower, offsets
+
+    lines = lower.split("\n")
+    lower_offsets = array("I", [0])
+    for line in lines:
+        lower_offsets.append(lower_offsets[-1] + len(line) + 1)
+    return lower, lower_offsets
+
+
+class Scrollback:
+    """Bounded, compact store for the lines that scrolled off the screen.
+
+    The store is filled by the pyte screen (possibly in the parser thread)
+    and read by the widget, all methods are guarded by one lock.
+    """
+
+    def __init__(self, max_lines: int = 10000, block_size: int = 256, compress: bool = True) -> None:
+        self.max_lines = max_lines
+        self.block_size = block_size
+        self.compress = compress
+
+        self._blocks: deque[_Block] = deque([_Block()])
+        self._lines = 0
+        # absolute index of the first stored line, grows when blocks are dropped
+        self.first = 0
+
+        self._style_ids: dict[tuple, int] = {DEFAULT_STYLE_KEY: 0}
+        self._styles: list[tuple] = [DEFAULT_STYLE_KEY]
+        self._decoded: OrderedDict[int, _DecodedBlock] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._lines
+
+    @property
+    def appended(self) -> int:
+        """Total number of lines ever appended (dropped lines included)."""
+
+        return self.first + self._lines
+
+    def style_id(self, style_key: tuple) -> int:
+        style_id = self._style_ids.get(style_key)
+        if style_id is None:
+            if len(self._styles) >= MAX_STYLES:
+                # e.g. a true color image dump: fall back to the default style
+                return 0
+            style_id = len(self._styles)
+            self._style_ids[style_key] = style_id
+            self._styles.append(style_key)
+        return style_id
+
+    def append(self, chars: tuple[Char, ...]) -> None:
+        """Adds one screen row, trailing default blanks are not stored."""
+
+        end = len(chars)
+        while end > 0 and chars[end - 1].data == " " and chars[end - 1][1:] == DEFAULT_STYLE_KEY:
+            end -= 1
+
+        with self._lock:
+            block = self._blocks[-1]
+            text = "".join(char.data for char in chars[:end])
+            block.text.append(text)
+            block.offsets.append(block.offsets[-1] + len(text) + 1)
+
+            spans = block.spans
+            run_start = 0
+            for x in range(1, end + 1):
+                if x < end and chars[x][1:] == chars[run_start][1:]:
+                    continue
+                # pyte stores wide chars as a char and an empty stub, the run
+                # length counts chars of `text`, not cells
+                length = sum(1 for char in chars[run_start:x] if char.data)
+                spans.append(min(length, 0xFFFF))
+                spans.append(self.style_id(chars[run_start][1:]))
+                run_start = x
+            block.span_offsets.append(len(spans))
+
+            block.lines += 1
+            self._lines += 1
+
+            if block.lines >= self.block_size:
+                block.freeze(self.compress)
+                self._blocks.append(_Block())
+
+            # whole blocks are dropped, so up to `block_size` lines more than
+            # `max_lines` can be kept
+            while self._lines - self._blocks[0].lines >= self.max_lines and len(self._blocks) > 1:
+                dropped = self._blocks.popleft()
+                self._lines -= dropped.lines
+                self.first += dropped.lines
+                self._decoded.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.first += self._lines
+            self._blocks = deque([_Block()])
+            self._lines = 0
+            self._decoded.clear()
+
+    def line(self, index: int) -> HistoryLine:
+        """Returns the line `index` (0 is the oldest stored line)."""
+
+        with self._lock:
+            block_index, line_index = self._locate(index)
+            block = self._blocks[block_index]
+            if isinstance(block.text, list):
+                # the block that is still being filled
+                text = block.text[line_index]
+                spans = block.spans
+            else:
+                decoded = self._decode(block_index)
+                start, end = decoded.offsets[line_index], decoded.offsets[line_index + 1] - 1
+                text = decoded.text[start:end]
+                spans = decoded.spans
+
+            spans = spans[block.span_offsets[line_index]:block.span_offsets[line_index + 1]]
+            styles = self._styles
+            return HistoryLine(
+                text,
+                tuple((spans[k], styles[spans[k + 1]]) for k in range(0, len(spans), 2)),
+            )
+
+    def search(self, query: str, before: int | None = None) -> int | None:
+        """Returns the index of the newest line before `before` containing `query`.
+
+        The search is case-insensitive and walks the blocks from the newest
+        one, each block is searched as one string and the match offset is
+        mapped back to its line through the block's line offsets.
+        """
+
+        if not query:
+            return None
+
+        query = query.lower()
+        with self._lock:
+            if before is None or before > self._lines:
+                before = self._lines
+
+            block_start = self._lines
+            for block_index in range(len(self._blocks) - 1, -1, -1):
+                block_start -= self._blocks[block_index].lines
+                if block_start >= before:
+                    continue
+
+                block = self._decode(block_index)
+                end = len(block.lower)
+                if before - block_start < self._blocks[block_index].lines:
+                    end = block.lower_offsets[before - block_start]
+
+                position = block.lower.rfind(query, 0, end)
+                if position >= 0:
+                    return block_start + bisect_right(block.lower_offsets, position) - 1
+
+        return None
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        if not 0 <= index < self._lines:
+            raise IndexError(index)
+
+        for block_index, block in enumerate(self._blocks):
+            if index < block.lines:
+                return block_index, index
+            index -= block.lines
+
+        raise IndexError(index)
+
+    def _decode(self, block_index: int) -> _DecodedBlock:
+        block = self._blocks[block_index]
+        if isinstance(block.text, list):
+            # the block that is still being filled
+            text = "\n".join(block.text)
+            lower, lower_offsets = _lower(text, block.offsets)
+            return _DecodedBlock(text, lower, block.offsets, block.spans, block.span_offsets, lower_offsets)
+
+        key = self.first + sum(self._blocks[k].lines for k in range(block_index))
+        decoded = self._decoded.get(key)
+        if decoded is not None:
+            self._decoded.move_to_end(key)
+            return decoded
+
+        if block.compressed:
+            text = zlib.decompress(block.text).decode()
+            spans = array("H", zlib.decompress(block.spans))
+        else:
+            text = block.text.decode()
+            spans = block.spans
+        lower, lower_offsets = _lower(text, block.offsets)
+        decoded = _DecodedBlock(text, lower, block.offsets, spans, block.span_offsets, lower_offsets)
+
+        self._decoded[key] = decoded
+        if len(self._decoded) > 4:
+            self._decoded.popitem(last=False)
+        return decoded
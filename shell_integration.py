@@ -0,0 +1,99 @@
+"""
+Shell integration for the terminal sessions.
+
+The spawned bash sources a generated rc file which loads the user's own
+startup files and then reports prompts and commands with OSC 133 marks:
+
+    ESC ] 133 ; A BEL        a prompt is shown
+    ESC ] 133 ; C BEL        a command starts running
+    ESC ] 133 ; D ; <n> BEL  the command finished with exit status <n>
+
+Commands sent by Terminal.run_command() run through __paperbrew_run, which
+adds the id of the command to both marks: `C;id=<id>` and `D;<n>;id=<id>`.
+
+TerminalPyteScreen picks the marks up while pyte parses the output.
+"""
+
+from __future__ import annotations
+
+import os
+import shlex
+import tempfile
+
+from history import paperbrew_cache_dir
+
+BASH_RC = r"""
+# generated by PaperBrew, loads the login startup files like `bash -l`
+if [ -f /etc/profile ]; then . /etc/profile; fi
+if [ -f ~/.bash_profile ]; then . ~/.bash_profile
+elif [ -f ~/.bash_login ]; then . ~/.bash_login
+elif [ -f ~/.profile ]; then . ~/.profile
+elif [ -f ~/.bashrc ]; then . ~/.bashrc
+fi
+
+__paperbrew_precmd() {
+    local status=$?
+    # D only closes a command that was marked with C: an empty line or
+    # Ctrl-C at the prompt ran nothing
+    if [ -n "$__paperbrew_running" ]; then
+        __paperbrew_running=
+        printf '\e]133;D;%s%s\a' "$status" "${__paperbrew_id:+;id=$__paperbrew_id}"
+        __paperbrew_id=
+    fi
+    printf '\e]133;A\a'
+}
+
+__paperbrew_preexec() {
+    # the DEBUG trap runs before every simple command: only mark the first
+    # one after a prompt, __paperbrew_armed is set by PROMPT_COMMAND last
+    [ -n "$__paperbrew_armed" ] || return 0
+    __paperbrew_armed=
+    # nothing ran if the first command is PROMPT_COMMAND itself, the rest of
+    # it runs disarmed
+    [ "$BASH_COMMAND" = "__paperbrew_precmd" ] && return 0
+    # __paperbrew_run marks the start itself, with the id
+    case "$BASH_COMMAND" in "__paperbrew_run "*) return 0 ;; esac
+    __paperbrew_running=1
+    printf '\e]133;C\a'
+}
+
+__paperbrew_run() {
+    # `__paperbrew_run <id> <command>`, sent by Terminal.run_command(): eval
+    # starts (and finishes) every line, even an empty one or a syntax error
+    # like a stray `fi` that bash would never start on its own
+    __paperbrew_id=$1
+    __paperbrew_running=1
+    printf '\e]133;C;id=%s\a' "$1"
+    eval "$2"
+}
+
+# newlines, not ";": the existing PROMPT_COMMAND may end with a ";" already
+PROMPT_COMMAND="__paperbrew_precmd"$'\n'"${PROMPT_COMMAND}"$'\n'"__paperbrew_armed=1"
+trap '__paperbrew_preexec' DEBUG
+"""
+
+
+def bash_command() -> str:
+    """Returns the command for an interactive bash with shell integration."""
+
+    # in the user's own cache dir: a predictable path in the shared /tmp
+    # could be created (or symlinked) by another user first
+    rc_dir = paperbrew_cache_dir()
+    rc_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    rc_file = rc_dir / "bashrc"
+    try:
+        current = rc_file.read_text()
+    except OSError:
+        current = None
+    if current != BASH_RC:
+        # replace, never write through an existing file or link
+        fd, temp = tempfile.mkstemp(dir=rc_dir, prefix=".bashrc.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(BASH_RC)
+            os.replace(temp, rc_file)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    return f"bash --rcfile {shlex.quote(str(rc_file))} -i"
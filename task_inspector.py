@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+
+from rich.text import Text
+from textual import events
+from textual.app import ComposeResult
+from textual.containers import VerticalScroll
+from textual.widgets import Static
+
+
+class TaskInspector(VerticalScroll):
+    """Lists the sampler subscriptions and workers with their cost per tick."""
+
+    def __init__(
+            self,
+            name: str | None = None,
+            id: str | None = None,
+            classes: str | None = None,
+    ):
+        super().__init__(name=name, id=id, classes=classes)
+        self.grabbed = False
+
+    def compose(self) -> ComposeResult:
+        yield Static("", id="task_inspector_text")
+
+    def on_mount(self) -> None:
+        self.update_tasks()
+        # a widget timer: stopped with the widget, nothing to clean up
+        self.set_interval(1, self.update_tasks)
+
+    def update_tasks(self) -> None:
+        if not self.screen.is_current:
+            # the panel is kept while hidden
+            return
+
+        metrics = self.app.metrics
+        text = Text(no_wrap=True, overflow="crop")
+
+        state = "running" if metrics.running else "stopped"
+        text.append(f"Sampler: {state}, every {metrics.interval:g}s, last tick {metrics.tick_time * 1000:.2f} ms\n",
+                    style="bold")
+        for metric, seconds in metrics.sample_times.items():
+            text.append(f"  {metric:<14} {seconds * 1000:8.2f} ms\n")
+
+        text.append(f"\n{"SUBSCRIBER":<28} {"METRICS":<24} {"STATE":<8} {"CALLS":>7} {"LAST ms":>8} {"AVG ms":>8}\n",
+                    style="bold")
+        for subscription in metrics.subscriptions:
+            if subscription.owner is None:
+                state = "always"
+            else:
+                state = "active" if subscription.active else "paused"
+            average = subscription.total_time / subscription.calls if subscription.calls else 0.0
+            text.append(
+                f"{subscription.name[:28]:<28} {",".join(sorted(subscription.metrics))[:24]:<24} {state:<8} "
+                f"{subscription.calls:>7} {subscription.last_time * 1000:>8.2f} {average * 1000:>8.2f}\n"
+            )
+
+        text.append(f"\n{"WORKER":<28} {"STATE":<10} NODE\n", style="bold")
+        for worker in self.app.workers:
+            text.append(f"{worker.name[:28]:<28} {worker.state.name:<10} {worker.node}\n")
+
+        text.append(f"\nasyncio tasks: {len(asyncio.all_tasks())}\n")
+        self.query_one("#task_inspector_text", Static).update(text)
+
+    async def on_mouse_down(self, event: events.MouseDown) -> None:
+        self.grabbed = True
+        event.stop()
+
+    async def on_mouse_up(self, event: events.MouseUp) -> None:
+        if self.grabbed:
+            self.grabbed = False
+        event.stop()
+
+    async def on_mouse_move(self, event: events.MouseMove) -> None:
+        if self.grabbed:
+            self.styles.offset = (self.offset.x + event.delta_x, self.offset.y + event.delta_y)
@@ -0,0 +1,43 @@
+"""
+Tests for metrics.py, run with `python -m pytest`.
+"""
+
+import asyncio
+
+import psutil
+
+from metrics import CPU, MEMORY, MetricsSampler, MetricsSnapshot
+
+
+def test_raising_subscriber_keeps_the_loop_alive():
+    snapshots: list[MetricsSnapshot] = []
+
+    def broken(snapshot: MetricsSnapshot) -> None:
+        raise RuntimeError("broken subscriber")
+
+    async def run() -> MetricsSampler:
+        sampler = MetricsSampler(interval=0.01)
+        sampler.subscribe(broken, MEMORY)
+        sampler.subscribe(snapshots.append, MEMORY)
+        await asyncio.sleep(0.2)
+        try:
+            assert sampler.running
+            assert not sampler._task.done()
+        finally:
+            sampler.unsubscribe(broken)
+            sampler.unsubscribe(snapshots.append)
+        return sampler
+
+    sampler = asyncio.run(run())
+    assert not sampler.running
+    assert len(snapshots) >= 3
+
+
+def test_raising_metric_is_none_in_the_snapshot(monkeypatch):
+    def cpu_percent(*args, **kwargs):
+        raise OSError("/proc/stat is gone")
+
+    monkeypatch.setattr(psutil, "cpu_percent", cpu_percent)
+    snapshot = MetricsSampler().sample(frozenset({CPU, MEMORY}))
+    assert snapshot.cpu_percent is None
+    assert snapshot.memory is not None
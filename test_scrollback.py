@@ -0,0 +1,26 @@
+"""
+Tests for scrollback.py, run with `python -m pytest`.
+"""
+
+import pytest
+from pyte.screens import Char
+
+from scrollback import Scrollback
+
+
+def row(text: str) -> tuple[Char, ...]:
+    return tuple(Char(data) for data in text)
+
+
+@pytest.mark.parametrize("block_size", [256, 2])
+def test_search_when_lower_changes_the_length(block_size):
+    # "İ".lower() is two code points: offsets of the original text are off
+    scrollback = Scrollback(block_size=block_size)
+    for text in ["İ" * 40, "a", "b", "target"]:
+        scrollback.append(row(text))
+
+    index = scrollback.search("target")
+    assert index == 3
+    assert scrollback.line(index).text == "target"
+    assert scrollback.search("İ") == 0
+    assert scrollback.search("a", before=3) == 1
@@ -16,47 +16,244 @@ import signal
 import shlex
 import asyncio
 from asyncio import Task
+import codecs
+from collections import deque
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import pty
 import struct
 import termios
 import re
+import time
+from functools import lru_cache
 from pathlib import Path
+from typing import NamedTuple
 
 import pyte
-from pyte.screens import Char
+from pyte import graphics
+from pyte.screens import Char, Margins
 
-from rich.text import Text
+from rich.segment import Segment
 from rich.style import Style
 from rich.color import ColorParseError
 
+from textual.app import ComposeResult
+from textual.cache import LRUCache
+from textual.geometry import Region
+from textual.message import Message
+from textual.screen import ModalScreen
+from textual.strip import Strip
 from textual.widget import Widget
+from textual.widgets import Input
 from textual import events
 
 from textual import log
 
+from scrollback import Scrollback
+
+# DEC private modes tracked by TerminalPyteScreen
+MOUSE_TRACKING_MODES = {1000, 1002, 1003}
+SGR_MOUSE_MODE = 1006
+BRACKETED_PASTE_MODE = 2004
+ALTERNATE_SCREEN_MODES = {47, 1047, 1049}
+BRACKETED_PASTE_START = "\x1b[200~"
+BRACKETED_PASTE_END = "\x1b[201~"
+
 
 class TerminalPyteScreen(pyte.Screen):
-    """Overrides the pyte.Screen class to be used with TERM=linux."""
+    """Overrides the pyte.Screen class to be used with TERM=linux.
+
+    Lines scrolled off the top of the screen are kept in `scrollback`.
+
+    The private modes the widget cares about are tracked in set_mode() and
+    reset_mode() while pyte parses them, so the output is only scanned once.
+    """
+
+    def __init__(self, columns: int, lines: int, scrollback: Scrollback | None = None):
+        super().__init__(columns, lines)
+        self.scrollback = scrollback
+
+    def reset(self):
+        super().reset()
+        self.mouse_tracking = False
+        self.sgr_mouse = False
+        self.bracketed_paste = False
+        self.alternate_screen = False
+        self._main_screen: dict | None = None
+        self.shell_marks: list[tuple[str, float]] = []
+
+    def set_mode(self, *modes, **kwargs):
+        if kwargs.get("private"):
+            self.set_private_modes(modes, True)
+        super().set_mode(*modes, **kwargs)
+
+    def reset_mode(self, *modes, **kwargs):
+        if kwargs.get("private"):
+            self.set_private_modes(modes, False)
+        super().reset_mode(*modes, **kwargs)
+
+    def set_private_modes(self, modes, value: bool) -> None:
+        """Tracks the DEC private modes (ESC [ ? <mode> h/l) of the widget."""
+
+        for mode in modes:
+            if mode in MOUSE_TRACKING_MODES:
+                self.mouse_tracking = value
+            elif mode == SGR_MOUSE_MODE:
+                self.sgr_mouse = value
+            elif mode == BRACKETED_PASTE_MODE:
+                self.bracketed_paste = value
+            elif mode in ALTERNATE_SCREEN_MODES and value != self.alternate_screen:
+                self.switch_screen(alternate=value, save_cursor=mode == 1049)
+
+    def switch_screen(self, alternate: bool, save_cursor: bool) -> None:
+        """Switches between the main and the alternate screen buffer.
+
+        pyte has a single buffer, so the main screen is stashed while a full
+        screen program (vim, htop, less, ...) draws on a blank one.
+        """
+
+        if alternate:
+            if save_cursor:
+                self.save_cursor()
+            self._main_screen = dict(self.buffer)
+            self.buffer.clear()
+        else:
+            self.buffer.clear()
+            self.buffer.update(self._main_screen or {})
+            self._main_screen = None
+            if save_cursor:
+                self.restore_cursor()
+
+        self.alternate_screen = alternate
+        self.dirty.update(range(self.lines))
 
     def set_margins(self, *args, **kwargs):
         kwargs.pop("private", None)
         return super().set_margins(*args, **kwargs)
 
+    def index(self):
+        if self.scrollback is not None and not self.alternate_screen:
+            top, bottom = self.margins or Margins(0, self.lines - 1)
+            # only full-screen scrolls, a scrolling region (e.g. a status bar
+            # in a TUI) does not push lines into the history
+            if top == 0 and bottom == self.lines - 1 and self.cursor.y == bottom:
+                line = self.buffer[top]
+                self.scrollback.append(tuple(line[x] for x in range(self.columns)))
+
+        super().index()
+
+    def erase_in_display(self, how=0, *args, **kwargs):
+        super().erase_in_display(how, *args, **kwargs)
+
+        # `clear` sends ESC [ 3 J to drop the scrollback too
+        if how == 3 and self.scrollback is not None:
+            self.scrollback.clear()
+
+    def set_icon_name(self, param):
+        # pyte reads a single char OSC code, so ESC ] 133 ; <mark> BEL arrives
+        # here as code "1" with the param "3;<mark>"
+        if param.startswith("3;"):
+            self.shell_marks.append((param[2:], time.monotonic()))
+            return
+        super().set_icon_name(param)
+
+    def take_shell_marks(self) -> list[tuple[str, float]]:
+        """Returns the shell integration marks (see shell_integration.py) and
+        their parse time, oldest first."""
+
+        marks, self.shell_marks = self.shell_marks, []
+        return marks
+
+
+_REVERSE = Style(reverse=True)
+_DEFAULT_STYLE_KEY = ("default", "default", False, False, False, False, False, False)
+_re_hex_color = re.compile("[0-9a-f]{6}", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def _detect_color(color: str) -> str:
+    """Maps a pyte color name to a Rich color, see Terminal.detect_color()."""
+
+    if color == "brown":
+        return "yellow"
 
-class TerminalDisplay:
-    """Rich display for the terminal."""
+    if color == "brightblack":
+        # fish tabbing through recommendations
+        return "#808080"
+
+    if _re_hex_color.match(color):
+        return f"#{color}"
+
+    return color
+
+
+# every color pyte can emit except true colors: named ANSI colors and the
+# 256-color palette (which pyte stores as hex without "#")
+_COLOR_TABLE: dict[str, str] = {
+    color: _detect_color(color)
+    for color in (
+        "default",
+        *graphics.FG_ANSI.values(),
+        *graphics.FG_AIXTERM.values(),
+        *graphics.BG_ANSI.values(),
+        *graphics.BG_AIXTERM.values(),
+        *graphics.FG_BG_256,
+    )
+}
+
+
+class CommandResult(NamedTuple):
+    """A command run by Terminal.run_command()."""
+
+    command: str
+    exit_code: int | None  # None if the shell reported no status, or it never ran
+    duration: float  # seconds between the command start and finish marks
+
+
+class ScreenSnapshot(NamedTuple):
+    """The lines of the pyte screen that changed since the last snapshot."""
+
+    lines: int
+    columns: int
+    cursor: tuple[int, int]
+    rows: dict[int, tuple[Char, ...]]
+    history: int  # Scrollback.appended when the snapshot was taken
+
+    def merge(self, newer: ScreenSnapshot) -> ScreenSnapshot:
+        return ScreenSnapshot(
+            newer.lines, newer.columns, newer.cursor, {**self.rows, **newer.rows}, newer.history
+        )
+
+
+class HistorySearch(ModalScreen[None]):
+    """The query prompt of Terminal.search_history (ctrl+f2 in a terminal).
+
+    Enter scrolls to the newest match above the view, pressing it again
+    goes on to older matches. Escape closes the prompt.
+    """
+
+    DEFAULT_CSS = """
+    HistorySearch {
+        align: center bottom;
+        background: $background 0%;
+    }
+    HistorySearch > Input {
+        width: 60%;
+    }
+    """
 
-    def __init__(self, lines):
-        self.lines = lines
+    BINDINGS = [("escape", "dismiss", "Close search")]
 
-    def __rich_console__(self, _console, _options):
-        line: Text
-        for line in self.lines:
-            yield line
+    def __init__(self, terminal: Terminal) -> None:
+        super().__init__()
+        self.terminal = terminal
 
+    def compose(self) -> ComposeResult:
+        yield Input(placeholder="Search the scrollback", id="history_search_input")
 
-_re_ansi_sequence = re.compile(r"(\x1b\[\??[\d;]*[a-zA-Z])")
-DECSET_PREFIX = "\x1b[?"
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.value and not self.terminal.search_history(event.value):
+            self.notify(f"{event.value!r} not found above the view", severity="warning")
 
 
 class Terminal(Widget, can_focus=True):
@@ -74,6 +271,12 @@ class Terminal(Widget, can_focus=True):
         self,
         command: str,
         default_colors: str | None = "system",
+        max_fps: int = 60,
+        parse_in_thread: bool = False,
+        scrollback_lines: int = 10000,
+        pool: ShellPool | None = None,
+        restart: bool = False,
+        shell_integration: bool = False,
         name: str | None = None,
         id: str | None = None,
         classes: str | None = None,
@@ -81,16 +284,36 @@ class Terminal(Widget, can_focus=True):
         super().__init__(name=name, id=id, classes=classes)
         self.command = command
         self.default_colors = default_colors
+        self.max_fps = max_fps
+        self.parse_in_thread = parse_in_thread
+        self.pool = pool
+        self.restart = restart
+        # `command` reports prompts and commands, see shell_integration.py
+        self.shell_integration = shell_integration
 
         if default_colors == "textual":
             self.textual_colors = self.detect_textual_colors()
-        self.mouse_tracking = False
 
         # variables used when starting the emulator: self.start()
         self.emulator: TerminalEmulator = None
         self.send_queue: asyncio.Queue = None
         self.recv_queue: asyncio.Queue = None
         self.recv_task: Task = None
+        self._started_at: float | None = None
+        # run_command(): the commands sent by id, the start of the running ones
+        self._commands: dict[int, tuple[str, asyncio.Future]] = {}
+        self._command_started: dict[int, float] = {}
+        self._command_ids = itertools.count(1)
+        self._parser: ThreadPoolExecutor | None = None
+
+        self.nrow = 24
+        self.ncol = 80
+
+        # frame scheduling, see schedule_render(). A suspended (hidden) terminal
+        # keeps parsing its output but does not draw until it is shown again.
+        self._render_handle: asyncio.TimerHandle | None = None
+        self._last_render: float = 0.0
+        self.suspended = True
 
         # OPTIMIZE: check a way to use textual.keys
         self.ctrl_keys = {
@@ -125,19 +348,70 @@ class Terminal(Widget, can_focus=True):
             "f19": "\x1b[33~",
             "f20": "\x1b[34~",
         }
-        self._display = self.initial_display()
-        self._screen = TerminalPyteScreen(80, 24)
+        self.scrollback = Scrollback(max_lines=scrollback_lines) if scrollback_lines else None
+        # number of history lines the view is scrolled up, 0 shows the screen
+        self.history_offset = 0
+        self._history = 0  # ScreenSnapshot.history of the displayed frame
+        self._screen = TerminalPyteScreen(80, 24, scrollback=self.scrollback)
         self.stream = pyte.Stream(self._screen)
 
+        # one row of Chars and one Strip per screen line: only lines in the
+        # ScreenSnapshot (and the lines touched by the cursor) are rebuilt in
+        # update_display()
+        self._snapshot: ScreenSnapshot | None = None
+        self._rows: list[tuple[Char, ...]] = []
+        self._strips: list[Strip] = []
+        self._strips_style: Style | None = None
+        self._strip_cache: LRUCache[tuple, Strip] = LRUCache(1024)
+        self._style_cache: LRUCache[tuple, Style | None] = LRUCache(4096)
+        self._cursor: tuple[int, int] = (0, 0)
+
     def on_mount(self, event: events.Mount) -> None:
         pass
 
+    def on_show(self) -> None:
+        self.suspended = False
+        self.refresh()
+        if self.emulator is not None:
+            self.schedule_render()
+
+    def on_hide(self) -> None:
+        self.suspended = True
+
+    @property
+    def mouse_tracking(self) -> bool:
+        return self._screen.mouse_tracking
+
+    @property
+    def alternate_screen(self) -> bool:
+        return self._screen.alternate_screen
+
+    class Started(Message):
+        """Posted when a started terminal shows its first prompt.
+
+        Without shell integration, the first output counts as the prompt.
+        """
+
+        def __init__(self, terminal: Terminal, startup_time: float) -> None:
+            self.terminal = terminal
+            self.startup_time = startup_time
+            """Seconds from start() to the first prompt."""
+            super().__init__()
+
     def start(self) -> None:
         if self.emulator is not None:
             return
 
-        self.emulator = TerminalEmulator(command=self.command)
-        self.emulator.start()
+        if self.parse_in_thread:
+            self._parser = ThreadPoolExecutor(max_workers=1, thread_name_prefix="terminal-parser")
+
+        self._started_at = time.monotonic()
+        if self.pool is not None:
+            # a pre-forked shell has usually printed its prompt already
+            self.emulator = self.pool.acquire()
+        else:
+            self.emulator = TerminalEmulator(command=self.command)
+            self.emulator.start()
         self.send_queue = self.emulator.recv_queue
         self.recv_queue = self.emulator.send_queue
         self.recv_task = asyncio.create_task(self.recv())
@@ -146,15 +420,28 @@ class Terminal(Widget, can_focus=True):
         if self.emulator is None:
             return
 
-        self._display = self.initial_display()
+        self._snapshot = None
+        self._rows = []
+        self._strips = []
+        if self._render_handle is not None:
+            self._render_handle.cancel()
+            self._render_handle = None
 
         self.recv_task.cancel()
 
+        for _, future in list(self._commands.values()):
+            future.cancel()
+        self._commands.clear()
+        self._command_started.clear()
+
         self.emulator.stop()
         self.emulator = None
-
-    def render(self):
-        return self._display
+        if self._parser is not None:
+            # waits for a feed() in progress, the screen is reset below
+            self._parser.shutdown(wait=True, cancel_futures=True)
+            self._parser = None
+        self._screen.reset()
+        self.refresh()
 
     async def on_key(self, event: events.Key) -> None:
         if self.emulator is None:
@@ -169,18 +456,45 @@ class Terminal(Widget, can_focus=True):
             return
 
         event.stop()
+        if event.key == "ctrl+f2":
+            self.app.push_screen(HistorySearch(self))
+            return
+        if event.key == "shift+pageup":
+            self.scroll_history(self.size.height - 1)
+            return
+        if event.key == "shift+pagedown":
+            self.scroll_history(-(self.size.height - 1))
+            return
+
         char = self.ctrl_keys.get(event.key) or event.character
         if char:
+            # typing jumps back to the prompt
+            self.scroll_history(-self.history_offset)
             await self.send_queue.put(["stdin", char])
 
+    async def on_paste(self, event: events.Paste) -> None:
+        if self.emulator is None:
+            return
+
+        event.stop()
+        # like xterm: newlines are sent as carriage returns
+        text = event.text.replace("\r\n", "\r").replace("\n", "\r")
+        if self._screen.bracketed_paste:
+            # the shell gets the paste as one unit and does not run the lines
+            text = f"{BRACKETED_PASTE_START}{text}{BRACKETED_PASTE_END}"
+
+        self.scroll_history(-self.history_offset)
+        await self.send_queue.put(["stdin", text])
+
     async def on_resize(self, _event: events.Resize) -> None:
-        self._screen.resize(_event.size.height, _event.size.width)
         self.ncol = self.size.width
         self.nrow = self.size.height
 
         if self.emulator is None:
+            self._screen.resize(_event.size.height, _event.size.width)
             return
 
+        await self.parse(self._screen.resize, _event.size.height, _event.size.width)
         await self.send_queue.put(["set_size", self.nrow, self.ncol])
         # self._screen.resize(self.nrow, self.ncol)
 
@@ -198,6 +512,9 @@ class Terminal(Widget, can_focus=True):
             return
 
         if self.mouse_tracking is False:
+            if self.history_offset:
+                event.stop()
+                self.scroll_history(-3)
             return
 
         await self.send_queue.put(["scroll", "down", event.x, event.y])
@@ -207,6 +524,9 @@ class Terminal(Widget, can_focus=True):
             return
 
         if self.mouse_tracking is False:
+            if self.scrollback is not None and len(self.scrollback) and not self.alternate_screen:
+                event.stop()
+                self.scroll_history(3)
             return
 
         await self.send_queue.put(["scroll", "up", event.x, event.y])
@@ -215,93 +535,382 @@ class Terminal(Widget, can_focus=True):
         try:
             while True:
                 message = await self.recv_queue.get()
-                cmd = message[0]
-                if cmd == "setup":
-                    await self.send_queue.put(["set_size", self.nrow, self.ncol])
-                elif cmd == "stdout":
-                    chars = message[1]
-
-                    # log("recv stdout:", chars)
-
-                    for sep_match in re.finditer(_re_ansi_sequence, chars):
-                        sequence = sep_match.group(0)
-                        if sequence.startswith(DECSET_PREFIX):
-                            parameters = sequence.removeprefix(DECSET_PREFIX).split(";")
-                            if "1000h" in parameters:
-                                self.mouse_tracking = True
-                            if "1000l" in parameters:
-                                self.mouse_tracking = False
-
-                    try:
-                        self.stream.feed(chars)
-                    except TypeError as error:
-                        # pyte could get into errors here: Screen.cursor_position()
-                        # is getting 4 args. Happens when TERM=linux and using
-                        # w3m (default options).
-
-                        # This also happened when TERM is not set to "linux" and w3m
-                        # is started without the option "-no-mouse".
-                        log.warning("could not feed:", error)
-
-                    lines = []
-                    last_char: Char
-                    last_style: Style
-                    for y in range(self._screen.lines):
-                        line_text = Text()
-                        line = self._screen.buffer[y]
-                        style_change_pos: int = 0
-                        for x in range(self._screen.columns):
-                            char: Char = line[x]
-
-                            line_text.append(char.data)
-
-                            # if style changed, stylize it with rich
-                            if x > 0:
-                                last_char = line[x - 1]
-                                if not self.char_style_cmp(char, last_char) or x == self._screen.columns - 1:
-                                    last_style = self.char_rich_style(last_char)
-                                    line_text.stylize(last_style, style_change_pos, x + 1)
-                                    style_change_pos = x
-
-                            if (
-                                self._screen.cursor.x == x
-                                and self._screen.cursor.y == y
-                            ):
-                                line_text.stylize("reverse", x, x + 1)
-
-                        lines.append(line_text)
-
-                    self._display = TerminalDisplay(lines)
-                    self.refresh()
-
-                elif cmd == "disconnect":
-                    self.stop()
+                await self.handle_message(message)
+
+                # feed everything the emulator already queued up before
+                # drawing: a burst of output costs one frame, not one per read
+                while not self.recv_queue.empty():
+                    await self.handle_message(self.recv_queue.get_nowait())
         except asyncio.CancelledError:
             # log.warning("Terminal.recv cancelled")
             pass
 
+    async def handle_message(self, message: list) -> None:
+        cmd = message[0]
+        if cmd == "setup":
+            await self.send_queue.put(["set_size", self.nrow, self.ncol])
+        elif cmd == "stdout":
+            chars = message[1]
+
+            # log("recv stdout:", chars)
+
+            await self.parse(self.feed, chars)
+
+            if self._started_at is not None and not self.shell_integration:
+                # without prompt marks, the first output is the best guess
+                self.report_started(time.monotonic())
+
+        elif cmd == "disconnect":
+            self.stop()
+            if self.restart:
+                # the shell exited: start a fresh one in its place, once this
+                # (cancelled) recv task is gone
+                self.call_later(self.start)
+
+    async def parse(self, func, *args) -> None:
+        """Runs `func(*args)` on the pyte screen and schedules a frame.
+
+        With `parse_in_thread`, `func` runs in the parser thread and the changed
+        lines come back as a ScreenSnapshot, so the event loop never touches the
+        pyte screen while it is being parsed.
+        """
+
+        if self._parser is None:
+            func(*args)
+            marks = self._screen.take_shell_marks()
+        else:
+            loop = asyncio.get_running_loop()
+            snapshot, marks = await loop.run_in_executor(self._parser, self._parse_snapshot, func, args)
+            if self._snapshot is None:
+                self._snapshot = snapshot
+            else:
+                self._snapshot = self._snapshot.merge(snapshot)
+
+        for mark, timestamp in marks:
+            self.handle_shell_mark(mark, timestamp)
+
+        self.schedule_render()
+
+    def _parse_snapshot(self, func, args: tuple) -> tuple[ScreenSnapshot, list]:
+        func(*args)
+        return self.take_snapshot(), self._screen.take_shell_marks()
+
+    def handle_shell_mark(self, mark: str, timestamp: float) -> None:
+        """Tracks the commands sent by run_command() through the OSC 133 marks."""
+
+        kind, *params = mark.split(";")
+        # only the marks of run_command() carry an id
+        ids = [int(param[3:]) for param in params if param.startswith("id=") and param[3:].isdigit()]
+        if kind == "A":
+            if self._started_at is not None:
+                self.report_started(timestamp)
+        elif kind == "C" and ids and ids[0] in self._commands:
+            self._command_started[ids[0]] = timestamp
+            # the shell reads the lines in order: an earlier command that did
+            # not start went to the program running then, it never will
+            for command_id in [i for i in self._commands if i < ids[0] and i not in self._command_started]:
+                self._finish_command(command_id, None, 0.0)
+        elif kind == "D" and ids and ids[0] in self._command_started:
+            exit_code = params[0] if params else ""
+            self._finish_command(
+                ids[0],
+                int(exit_code) if exit_code.isdigit() else None,
+                timestamp - self._command_started[ids[0]],
+            )
+
+    def _finish_command(self, command_id: int, exit_code: int | None, duration: float) -> None:
+        command, future = self._commands.pop(command_id)
+        self._command_started.pop(command_id, None)
+        if not future.done():
+            future.set_result(CommandResult(command=command, exit_code=exit_code, duration=duration))
+
+    def _forget_command(self, command_id: int) -> None:
+        # a future cancelled (or timed out) by the caller
+        self._commands.pop(command_id, None)
+        self._command_started.pop(command_id, None)
+
+    def run_command(self, command: str) -> asyncio.Future[CommandResult]:
+        """Sends `command` to the shell, the future is resolved when it finished.
+
+        Needs a shell with shell integration (see shell_integration.py): the
+        command runs through `__paperbrew_run <id>`, and is matched to the
+        start and finish marks with its id.
+        """
+
+        command_id = next(self._command_ids)
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._forget_command(command_id))
+        self._commands[command_id] = (command, future)
+        quoted = shlex.quote(command.rstrip("\n"))
+        self.send_queue.put_nowait(["stdin", f"__paperbrew_run {command_id} {quoted}\n"])
+        return future
+
+    def report_started(self, timestamp: float) -> None:
+        startup_time = timestamp - self._started_at
+        self._started_at = None
+        log(f"{self.id}: ready after {startup_time:.3f}s")
+        self.post_message(self.Started(self, startup_time))
+
+    def feed(self, chars: str) -> None:
+        try:
+            self.stream.feed(chars)
+        except TypeError as error:
+            # pyte could get into errors here: Screen.cursor_position()
+            # is getting 4 args. Happens when TERM=linux and using
+            # w3m (default options).
+
+            # This also happened when TERM is not set to "linux" and w3m
+            # is started without the option "-no-mouse".
+            log.warning("could not feed:", error)
+
+    def take_snapshot(self) -> ScreenSnapshot:
+        """Returns the dirty lines of the pyte screen and clears them."""
+
+        screen = self._screen
+        buffer = screen.buffer
+        columns = range(screen.columns)
+        rows = {}
+        for y in screen.dirty:
+            if y < screen.lines:
+                line = buffer[y]
+                rows[y] = tuple(line[x] for x in columns)
+        screen.dirty.clear()
+
+        return ScreenSnapshot(
+            lines=screen.lines,
+            columns=screen.columns,
+            cursor=(screen.cursor.x, screen.cursor.y),
+            rows=rows,
+            history=self.scrollback.appended if self.scrollback is not None else 0,
+        )
+
+    def schedule_render(self) -> None:
+        """Schedules update_display(), at most once per frame (see max_fps).
+
+        Nothing is drawn while the terminal is suspended.
+        """
+
+        if self._render_handle is not None:
+            # a frame is already pending, it will pick up the new screen state
+            return
+
+        if self.suspended:
+            # the changes pile up in the screen's dirty lines (or the pending
+            # ScreenSnapshot) and are drawn at once by on_show()
+            return
+
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, self._last_render + 1 / self.max_fps - loop.time())
+        self._render_handle = loop.call_later(delay, self._render_frame)
+
+    def _render_frame(self) -> None:
+        self._render_handle = None
+        self._last_render = asyncio.get_running_loop().time()
+        self.update_display()
+
+    def update_display(self) -> None:
+        """Rebuilds the strips of the changed screen lines and refreshes them."""
+
+        if self._parser is None:
+            snapshot = self.take_snapshot()
+        else:
+            snapshot, self._snapshot = self._snapshot, None
+            if snapshot is None:
+                return
+
+        changed = set(snapshot.rows)
+
+        rich_style = self.rich_style
+        if rich_style != self._strips_style:
+            # the widget style is baked into the cached strips
+            self._strips_style = rich_style
+            self._strip_cache.clear()
+            changed.update(range(len(self._rows)))
+
+        if len(self._rows) != snapshot.lines:
+            # first draw or resize: the screen marked every line dirty
+            self._rows = [()] * snapshot.lines
+            self._strips = [Strip.blank(snapshot.columns, rich_style)] * snapshot.lines
+        for y, row in snapshot.rows.items():
+            if y < snapshot.lines:
+                self._rows[y] = row
+
+        # the cursor is drawn as a reversed char, so the line it left and the
+        # line it moved to have to be rebuilt even if pyte did not touch them
+        if snapshot.cursor != self._cursor:
+            changed.add(self._cursor[1])
+            changed.add(snapshot.cursor[1])
+            self._cursor = snapshot.cursor
+
+        cursor_x, cursor_y = self._cursor
+        regions = []
+        for y in sorted(changed):
+            if y >= snapshot.lines:
+                continue
+            self._strips[y] = self.line_strip(self._rows[y], cursor_x if y == cursor_y else -1)
+            regions.append(Region(0, y, self.size.width, 1))
+
+        history = self._history
+        self._history = snapshot.history
+        if self.history_offset:
+            # keep the view on the same history lines while output scrolls
+            self.scroll_history(snapshot.history - history)
+            self.refresh()
+        elif regions:
+            self.refresh(*regions)
+
+    def render_line(self, y: int) -> Strip:
+        if self.history_offset:
+            # the view starts `history_offset` lines above the screen
+            y -= self.history_offset
+            if y < 0:
+                return self.history_strip(self._history + y)
+
+        if y >= len(self._strips):
+            return Strip.blank(self.size.width, self.rich_style)
+
+        return self._strips[y].adjust_cell_length(self.size.width, self.rich_style)
+
+    def history_strip(self, index: int) -> Strip:
+        """Returns the scrollback line with the absolute `index` as a Strip."""
+
+        index -= self.scrollback.first
+        if index < 0:
+            # dropped from the scrollback in the meantime
+            return Strip.blank(self.size.width, self.rich_style)
+
+        line = self.scrollback.line(index)
+        strip = self._strip_cache.get(line)
+        if strip is None:
+            base_style = self._strips_style
+            segments = []
+            start = 0
+            for length, style_key in line.spans:
+                style = self.style_key_rich_style(style_key)
+                text = line.text[start:start + length]
+                segments.append(Segment(text, base_style + style if style is not None else base_style))
+                start += length
+            strip = Strip(segments)
+            self._strip_cache.set(line, strip)
+
+        return strip.adjust_cell_length(self.size.width, self.rich_style)
+
+    def scroll_history(self, lines: int) -> None:
+        """Scrolls the view `lines` up into the scrollback (down if negative)."""
+
+        if self.scrollback is None:
+            return
+
+        available = min(self._history - self.scrollback.first, len(self.scrollback))
+        offset = max(0, min(self.history_offset + lines, available))
+        if offset != self.history_offset:
+            self.history_offset = offset
+            self.refresh()
+
+    def search_history(self, query: str) -> bool:
+        """Scrolls the newest scrollback line containing `query` (above the
+        current view) to the top of the view.
+
+        Returns:
+            True if a line was found.
+        """
+
+        if self.scrollback is None:
+            return False
+
+        # absolute index of the top line of the view
+        top = self._history - self.history_offset
+        index = self.scrollback.search(query, before=top - self.scrollback.first)
+        if index is None:
+            return False
+
+        self.history_offset = self._history - (self.scrollback.first + index)
+        self.refresh()
+        return True
+
+    def line_strip(self, chars: tuple[Char, ...], cursor_x: int) -> Strip:
+        """Returns a row of pyte.Chars as a Strip.
+
+        Strips are cached by line content, so lines that did not change (or
+        that repeat, like blank lines) do not build new segments.
+        """
+
+        key = (cursor_x, chars)
+        strip = self._strip_cache.get(key)
+        if strip is None:
+            strip = self.chars_strip(chars, cursor_x)
+            self._strip_cache.set(key, strip)
+
+        return strip
+
+    def chars_strip(self, chars: tuple[Char, ...], cursor_x: int) -> Strip:
+        """Builds a Strip from a row of pyte.Chars, one Segment per style run."""
+
+        base_style = self._strips_style
+        style_keys = [char[1:] for char in chars]
+        segments = []
+        run_start = 0
+        for x in range(1, len(chars) + 1):
+            # the cursor is a run of its own
+            if (
+                x < len(chars)
+                and x != cursor_x
+                and x - 1 != cursor_x
+                and style_keys[x] == style_keys[run_start]
+            ):
+                continue
+
+            text = "".join(char.data for char in chars[run_start:x])
+            style = self.style_key_rich_style(style_keys[run_start])
+            if run_start == cursor_x:
+                style = style + _REVERSE if style is not None else _REVERSE
+            segments.append(Segment(text, base_style + style if style is not None else base_style))
+            run_start = x
+
+        return Strip(segments)
+
     def char_rich_style(self, char: Char) -> Style:
         """Returns a rich.Style from the pyte.Char."""
 
-        foreground = self.detect_color(char.fg)
-        background = self.detect_color(char.bg)
+        return self.style_key_rich_style(char[1:])
+
+    def style_key_rich_style(self, style_key: tuple) -> Style | None:
+        """Returns the rich.Style for the style fields of a pyte.Char.
+
+        `style_key` is `char[1:]`: (fg, bg, bold, italics, underscore,
+        strikethrough, reverse, blink). Styles are interned in a LRU table, so
+        every distinct pyte style is parsed once instead of once per frame.
+        """
+
+        if style_key in self._style_cache:
+            return self._style_cache[style_key]
+
+        fg, bg, bold, italics, underscore, strikethrough, reverse, blink = style_key
+        foreground = self.detect_color(fg)
+        background = self.detect_color(bg)
         if self.default_colors == "textual":
             if background == "default":
                 background = self.textual_colors["background"]
             if foreground == "default":
                 foreground = self.textual_colors["foreground"]
 
-        style: Style
+        style: Style | None
         try:
             style = Style(
                 color=foreground,
                 bgcolor=background,
-                bold=char.bold,
+                bold=bold,
+                italic=italics,
+                underline=underscore,
+                strike=strikethrough,
+                reverse=reverse,
+                blink=blink,
             )
         except ColorParseError as error:
             log.warning("color parse error:", error)
             style = None
 
+        self._style_cache.set(style_key, style)
         return style
 
     def char_style_cmp(self, given: Char, other: Char) -> bool:
@@ -312,36 +921,13 @@ class Terminal(Widget, can_focus=True):
             False   if char styles differ
         """
 
-        if (
-            given.fg == other.fg
-            and given.bg == other.bg
-            and given.bold == other.bold
-            and given.italics == other.italics
-            and given.underscore == other.underscore
-            and given.strikethrough == other.strikethrough
-            and given.reverse == other.reverse
-            and given.blink == other.blink
-        ):
-            return True
-
-        return False
+        # every field except `data` is a style field
+        return given[1:] == other[1:]
 
     def char_style_default(self, char: Char) -> bool:
         """Returns True if the given char has a default style."""
 
-        if (
-            char.fg == "default"
-            and char.bg == "default"
-            and char.bold is False
-            and char.italics is False
-            and char.underscore is False
-            and char.strikethrough is False
-            and char.reverse is False
-            and char.blink is False
-        ):
-            return True
-
-        return False
+        return char[1:] == _DEFAULT_STYLE_KEY
 
     def detect_color(self, color: str) -> str:
         """Tries to detect the correct Rich-Color based on a color name.
@@ -353,30 +939,26 @@ class Terminal(Widget, can_focus=True):
           * htop is using "brown" => not an ANSI color
         """
 
-        if color == "brown":
-            return "yellow"
-
-        if color == "brightblack":
-            # fish tabbing through recommendations
-            return "#808080"
-
-        if re.match("[0-9a-f]{6}", color, re.IGNORECASE):
-            return f"#{color}"
-
-        return color
+        rich_color = _COLOR_TABLE.get(color)
+        if rich_color is None:
+            # true colors (38;2;r;g;b) are not in the precomputed table
+            rich_color = _detect_color(color)
+        return rich_color
 
     def detect_textual_colors(self) -> dict:
         """Returns the currently used colors of textual depending on dark-mode."""
 
         return self.app.current_theme.to_color_system().generate()
 
-    def initial_display(self) -> TerminalDisplay:
-        """Returns the display when initially creating the terminal or clearing it."""
-
-        return TerminalDisplay([Text()])
-
 
 class TerminalEmulator:
+    READ_SIZE = 65536
+    """Bytes read from the PTY per call."""
+    MAX_BACKLOG = 4 * 65536
+    """Chars of decoded output held back before reading from the PTY is paused."""
+    SEND_QUEUE_SIZE = 8
+    """Messages queued for the Terminal widget before _send_data() waits."""
+
     def __init__(self, command: str):
         # FIXME: fix ResourceWarning (manually close the fd / p_out broke (blocking)
         """
@@ -390,16 +972,30 @@ class TerminalEmulator:
 
         It maybe has to be implemented somewhere at the CancelledError.
         """
-        self.data_or_disconnect = None
         self.run_task: asyncio.Task = None
         self.send_task: asyncio.Task = None
 
         self.fd = self.open_terminal(command=command)
         self.p_out = os.fdopen(self.fd, "w+b", 0)  # 0: buffering off
         self.recv_queue = asyncio.Queue()
-        self.send_queue = asyncio.Queue()
+        # bounded: when the widget falls behind, _send_data() blocks on put()
+        self.send_queue = asyncio.Queue(maxsize=self.SEND_QUEUE_SIZE)
         self.event = asyncio.Event()
 
+        # read path: PTY -> reusable buffer -> incremental decoder -> chunks
+        self._read_buffer = bytearray(self.READ_SIZE)
+        self._read_view = memoryview(self._read_buffer)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._chunks: deque[str] = deque()
+        self._backlog = 0  # number of chars in self._chunks
+        self._reading = False
+        self._disconnected = False
+
+        # write path: input is buffered and written without blocking, see flush()
+        os.set_blocking(self.fd, False)
+        self._write_buffer = bytearray()
+        self._writing = False
+
     def start(self):
         self.run_task = asyncio.create_task(self._run())
         self.send_task = asyncio.create_task(self._send_data())
@@ -407,9 +1003,18 @@ class TerminalEmulator:
     def stop(self):
         self.run_task.cancel()
         self.send_task.cancel()
+        self.pause_reading()
+        if self._writing:
+            asyncio.get_running_loop().remove_writer(self.fd)
+            self._writing = False
 
-        os.kill(self.pid, signal.SIGTERM)
-        os.waitpid(self.pid, 0)
+        # SIGHUP like a closed terminal window: an interactive bash ignores
+        # SIGTERM, so waitpid() would block on an idle (e.g. pooled) shell
+        try:
+            os.kill(self.pid, signal.SIGHUP)
+            os.waitpid(self.pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
 
     def open_terminal(self, command: str):
         self.pid, fd = pty.fork()
@@ -421,51 +1026,110 @@ class TerminalEmulator:
 
         return fd
 
-    async def _run(self):
-        loop = asyncio.get_running_loop()
+    def pause_reading(self) -> None:
+        if self._reading:
+            asyncio.get_running_loop().remove_reader(self.p_out)
+            self._reading = False
+
+    def resume_reading(self) -> None:
+        if not self._reading and not self._disconnected:
+            asyncio.get_running_loop().add_reader(self.p_out, self._on_output)
+            self._reading = True
 
-        def on_output():
+    def _on_output(self) -> None:
+        try:
+            size = self.p_out.readinto(self._read_buffer)
+        except OSError:
+            # this exception tell's us to end the emulator:
+            # throwed when exiting the command
+            size = 0
+
+        if size is None:
+            # nothing to read after all
+            return
+
+        if size == 0:
+            self.pause_reading()
+            self._disconnected = True
+            self._chunks.append(self._decoder.decode(b"", final=True))
+        else:
+            # the incremental decoder keeps UTF-8 sequences that are split
+            # across two reads, invalid bytes are replaced, never dropped
+            chars = self._decoder.decode(self._read_view[:size])
+            self._chunks.append(chars)
+            self._backlog += len(chars)
+            if self._backlog > self.MAX_BACKLOG:
+                # the widget is behind: leave the rest in the PTY until it
+                # caught up, the child process blocks on its writes meanwhile
+                self.pause_reading()
+        self.event.set()
+
+    def write(self, data: bytes) -> None:
+        """Queues `data` for the PTY, it is written by flush()."""
+
+        self._write_buffer += data
+
+    def flush(self) -> None:
+        """Writes as much of the pending input as the PTY takes without blocking.
+
+        The rest is written from the writer-ready callback once the child
+        process has read its input.
+        """
+
+        if self._write_buffer:
             try:
-                self.data_or_disconnect = self.p_out.read(65536).decode()
-                self.event.set()
-            except UnicodeDecodeError as error:
-                # NOTE: this happens sometimes, eg in w3m browsing wrongly decoded docs
-                # OPTIMIZE: here a screen refresh could be needed. some chars are
-                #   left in the buffer when scrolling
-                log.warning("decode error:", error)
-            except Exception:
-                # this exception tell's us to end the emulator:
-                # throwed when exiting the command
-                loop.remove_reader(self.p_out)
-                self.data_or_disconnect = None
-                self.event.set()
-
-        loop.add_reader(self.p_out, on_output)
+                written = os.write(self.fd, self._write_buffer)
+            except BlockingIOError:
+                written = 0
+            except OSError:
+                # the command exited, _on_output() handles the disconnect
+                written = len(self._write_buffer)
+            del self._write_buffer[:written]
+
+        loop = asyncio.get_running_loop()
+        if self._write_buffer and not self._writing:
+            loop.add_writer(self.fd, self.flush)
+            self._writing = True
+        elif not self._write_buffer and self._writing:
+            loop.remove_writer(self.fd)
+            self._writing = False
+
+    def handle_message(self, msg: list) -> None:
+        if msg[0] == "stdin":
+            self.write(msg[1].encode())
+        elif msg[0] == "set_size":
+            winsize = struct.pack("HH", msg[1], msg[2])
+            fcntl.ioctl(self.fd, termios.TIOCSWINSZ, winsize)
+        elif msg[0] == "click":
+            x = msg[1] + 1
+            y = msg[2] + 1
+            button = msg[3]
+
+            if button == 1:
+                self.write(f"\x1b[<0;{x};{y}M".encode())
+                self.write(f"\x1b[<0;{x};{y}m".encode())
+        elif msg[0] == "scroll":
+            x = msg[2] + 1
+            y = msg[3] + 1
+
+            if msg[1] == "up":
+                self.write(f"\x1b[<64;{x};{y}M".encode())
+            if msg[1] == "down":
+                self.write(f"\x1b[<65;{x};{y}M".encode())
+
+    async def _run(self):
+        self.resume_reading()
         await self.send_queue.put(["setup", {}])
         try:
             while True:
-                msg = await self.recv_queue.get()
-                if msg[0] == "stdin":
-                    self.p_out.write(msg[1].encode())
-                elif msg[0] == "set_size":
-                    winsize = struct.pack("HH", msg[1], msg[2])
-                    fcntl.ioctl(self.fd, termios.TIOCSWINSZ, winsize)
-                elif msg[0] == "click":
-                    x = msg[1] + 1
-                    y = msg[2] + 1
-                    button = msg[3]
-
-                    if button == 1:
-                        self.p_out.write(f"\x1b[<0;{x};{y}M".encode())
-                        self.p_out.write(f"\x1b[<0;{x};{y}m".encode())
-                elif msg[0] == "scroll":
-                    x = msg[2] + 1
-                    y = msg[3] + 1
-
-                    if msg[1] == "up":
-                        self.p_out.write(f"\x1b[<64;{x};{y}M".encode())
-                    if msg[1] == "down":
-                        self.p_out.write(f"\x1b[<65;{x};{y}M".encode())
+                self.handle_message(await self.recv_queue.get())
+
+                # coalesce everything queued meanwhile (typing, a paste) into
+                # one write instead of one syscall per key
+                while not self.recv_queue.empty():
+                    self.handle_message(self.recv_queue.get_nowait())
+
+                self.flush()
         except asyncio.CancelledError:
             # log.warning("TerminalEmulator._run cancelled")
             pass
@@ -475,11 +1139,59 @@ class TerminalEmulator:
             while True:
                 await self.event.wait()
                 self.event.clear()
-                if self.data_or_disconnect is not None:
-                    await self.send_queue.put(["stdout", self.data_or_disconnect])
-                else:
+                while self._chunks:
+                    # everything read since the last message is sent in one go
+                    data = "".join(self._chunks)
+                    self._chunks.clear()
+                    self._backlog = 0
+                    if data:
+                        await self.send_queue.put(["stdout", data])
+
+                if self._disconnected:
                     await self.send_queue.put(["disconnect", 1])
+                    return
+
+                self.resume_reading()
         except asyncio.CancelledError:
             # log.warning("TerminalEmulator._send_data cancelled")
             # os.close(self.fd)  # does not fix the error above, maybe too late
             pass
+
+
+class ShellPool:
+    """Pre-forked, started TerminalEmulators for new terminal sessions.
+
+    A login shell sourcing ~/.bashrc (conda hooks and all) takes seconds to
+    print its prompt. The pool forks `size` shells in the background, so a
+    new session, or a session restarting after `exit`, gets a shell that is
+    already at its prompt. Its output waits in the emulator's send_queue.
+    """
+
+    def __init__(self, command: str, size: int = 2):
+        self.command = command
+        self.size = size
+        self._idle: deque[TerminalEmulator] = deque()
+
+    def fill(self) -> None:
+        """Forks shells until `size` of them are idle."""
+
+        while len(self._idle) < self.size:
+            emulator = TerminalEmulator(command=self.command)
+            emulator.start()
+            self._idle.append(emulator)
+
+    def acquire(self) -> TerminalEmulator:
+        """Returns a started emulator, the pool is refilled after this call."""
+
+        if self._idle:
+            emulator = self._idle.popleft()
+        else:
+            emulator = TerminalEmulator(command=self.command)
+            emulator.start()
+
+        asyncio.get_running_loop().call_soon(self.fill)
+        return emulator
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.popleft().stop()